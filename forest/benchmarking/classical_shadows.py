@@ -0,0 +1,224 @@
+"""
+Estimation of many observables of a state from randomized single qubit Pauli measurements,
+a.k.a. classical shadows.
+
+Rather than the 4^n (or 3^n) settings of full state tomography, each shot measures every qubit
+in an independently and uniformly random Pauli basis. Every local observable and the fidelity
+with any target state can then be estimated from the same snapshots, with a number of shots
+that depends on the locality of the observable rather than on the number of qubits.
+
+[SHADOW] Predicting many properties of a quantum system from very few measurements
+         Huang, Kueng, Preskill,
+         Nat. Phys. 16, 1050 (2020)
+         https://doi.org/10.1038/s41567-020-0932-7
+         https://arxiv.org/abs/2002.08953
+"""
+import functools
+from dataclasses import dataclass
+from operator import mul
+from typing import List, Sequence
+
+import numpy as np
+
+from forest.benchmarking.compilation import basic_compile
+from forest.benchmarking.utils import LOCAL_STATE_BLOCH_ANGLES
+from pyquil import Program
+from pyquil.api import QuantumComputer
+from pyquil.gates import RX, RZ, MEASURE
+from pyquil.operator_estimation import ExperimentSetting, TomographyExperiment, zeros_state
+from pyquil.paulis import PauliTerm, sX, sY, sZ, is_identity
+
+# Snapshot bases are stored as indices into this string, so that 0 never denotes a basis
+PAULIS = 'IXYZ'
+
+
+@dataclass
+class ShadowData:
+    """Snapshots from randomized Pauli measurements of the state prepared by `program`"""
+
+    program: Program
+    """The pyquil Program preparing the measured state"""
+
+    qubits: List[int]
+    """The measured qubits; column i of `bases` and `outcomes` refers to qubits[i]"""
+
+    bases: np.ndarray
+    """(n_shots, n_qubits) uint8 array of measured Paulis, as indices 1, 2, 3 into 'IXYZ'"""
+
+    outcomes: np.ndarray
+    """(n_shots, n_qubits) uint8 array of measurement outcomes; 0 is the +1 eigenvalue"""
+
+
+def generate_shadow_experiment(program: Program, qubits: List[int], n_bases: int,
+                               rs=None) -> TomographyExperiment:
+    """
+    Generate a (pyQuil) TomographyExperiment whose settings are `n_bases` uniformly random
+    measurement bases, each given by a Pauli operator acting on all of the qubits.
+
+    :param program: The program preparing the state to characterize.
+    :param qubits: The qubits to measure.
+    :param n_bases: The number of random bases.
+    :param rs: Optional random state.
+    :return: The experiment, to be run with :py:func:`acquire_shadow_data`.
+    """
+    if rs is None:
+        rs = np.random
+    choices = rs.randint(3, size=(n_bases, len(qubits)))
+    settings = []
+    for choice in choices:
+        out_op = functools.reduce(mul, ([sX, sY, sZ][op](q) for op, q in zip(choice, qubits)))
+        settings.append(ExperimentSetting(in_state=zeros_state(qubits), out_operator=out_op))
+    return TomographyExperiment(settings=settings, program=program, qubits=qubits)
+
+
+def _basis_change(qubits: Sequence[int], angles) -> Program:
+    """
+    A parametric change into the measurement basis, the inverse of the preparation of the +1
+    eigenstate in :py:func:`forest.benchmarking.utils.prepare_parametric_prod_state`.
+
+    :param qubits: The qubits to measure.
+    :param angles: A REAL memory region (or any indexable of floats) with 2 * len(qubits)
+        entries, see :py:func:`_measurement_angles`.
+    """
+    program = Program()
+    for idx, qubit in enumerate(qubits):
+        program += RZ(angles[2 * idx], qubit)
+        program += RX(np.pi / 2, qubit)
+        program += RZ(angles[2 * idx + 1], qubit)
+        program += RX(np.pi / 2, qubit)
+    return program
+
+
+def _measurement_angles(out_operator: PauliTerm, qubits: Sequence[int]) -> List[float]:
+    """
+    The angles for :py:func:`_basis_change` that rotate the eigenbasis of each qubit's Pauli in
+    `out_operator` to the computational basis.
+    """
+    angles = []
+    for qubit in qubits:
+        theta, phi = LOCAL_STATE_BLOCH_ANGLES[out_operator[qubit] + '0']
+        angles += [-phi, np.pi - theta]
+    return angles
+
+
+def acquire_shadow_data(qc: QuantumComputer, experiment: TomographyExperiment,
+                        shots_per_basis: int = 1) -> ShadowData:
+    """
+    Measure the state prepared by the experiment program in each of the experiment bases.
+
+    All bases share a single parametric executable, with the basis change chosen at run time
+    through the memory map.
+
+    :param qc: A quantum computer object where the experiment will run.
+    :param experiment: An experiment from :py:func:`generate_shadow_experiment`.
+    :param shots_per_basis: The number of shots taken in each basis.
+    :return: The snapshots.
+    """
+    qubits = list(experiment.qubits)
+    program = experiment.program.copy()
+    angles = program.declare('shadow_angles', 'REAL', 2 * len(qubits))
+    program += _basis_change(qubits, angles)
+    ro = program.declare('ro', 'BIT', len(qubits))
+    for idx, qubit in enumerate(qubits):
+        program += MEASURE(qubit, ro[idx])
+    program.wrap_in_numshots_loop(shots_per_basis)
+    executable = qc.compiler.native_quil_to_executable(basic_compile(program))
+
+    bases = []
+    outcomes = []
+    for settings in experiment:
+        for setting in settings:
+            memory_map = {'shadow_angles': _measurement_angles(setting.out_operator, qubits)}
+            outcomes.append(np.asarray(qc.run(executable, memory_map=memory_map), dtype=np.uint8))
+            basis = [PAULIS.index(setting.out_operator[qubit]) for qubit in qubits]
+            bases.append(np.tile(np.array(basis, dtype=np.uint8), (len(outcomes[-1]), 1)))
+
+    return ShadowData(program=experiment.program, qubits=qubits,
+                      bases=np.concatenate(bases), outcomes=np.concatenate(outcomes))
+
+
+def _median_of_means(values: np.ndarray, n_groups: int) -> np.ndarray:
+    """
+    The median of the means of `n_groups` equal consecutive groups along the last axis, dropping
+    the remainder.
+    """
+    n_samples = values.shape[-1]
+    if not 0 < n_groups <= n_samples:
+        raise ValueError(f"Can't split {n_samples} snapshots into {n_groups} groups.")
+    group_size = n_samples // n_groups
+    groups = values[..., :n_groups * group_size].reshape(values.shape[:-1] + (n_groups, group_size))
+    return np.median(groups.mean(axis=-1), axis=-1)
+
+
+def estimate_pauli_expectations(data: ShadowData, observables: Sequence[PauliTerm],
+                                n_groups: int = 10) -> np.ndarray:
+    """
+    Estimate the expectations of (typically few-body) Pauli operators from the snapshots.
+
+    The snapshot estimate of a Pauli P with support S is 3^|S| (-1)^(sum of outcomes on S) if
+    every qubit of S was measured in the basis of P, and 0 otherwise [SHADOW]. Estimates are
+    combined by median of means; each observable costs O(n_shots |S|) time and memory.
+
+    :param data: The snapshots.
+    :param observables: Pauli operators on (a subset of) data.qubits; the coefficients, which must
+        be real so that the observables are Hermitian, are included in the estimates.
+    :param n_groups: The number of groups for the median of means.
+    :return: The estimated expectation of each observable.
+    """
+    estimates = np.zeros(len(observables))
+    for obs_idx, term in enumerate(observables):
+        if not np.isclose(np.imag(term.coefficient), 0):
+            raise ValueError(f"The observable {term} is not Hermitian; its coefficient must be "
+                             f"real.")
+        if is_identity(term):
+            estimates[obs_idx] = np.real(term.coefficient)
+            continue
+        columns = [data.qubits.index(qubit) for qubit, _ in term]
+        paulis = np.array([PAULIS.index(op) for _, op in term], dtype=np.uint8)
+        matches = np.all(data.bases[:, columns] == paulis, axis=1)
+        signs = 1 - 2 * (np.sum(data.outcomes[:, columns], axis=1, dtype=int) % 2)
+        values = 3. ** len(columns) * matches * signs
+        estimates[obs_idx] = np.real(term.coefficient) * _median_of_means(values, n_groups)
+    return estimates
+
+
+def estimate_fidelity(data: ShadowData, target_state: np.ndarray, n_groups: int = 10,
+                      batch_size: int = None) -> float:
+    """
+    Estimate the fidelity <psi|rho|psi> of the measured state rho with a pure target state.
+
+    The snapshot estimate is <psi| (x)_q (I + 3 (-1)^s_q P_q) / 2 |psi> for measured Paulis P_q
+    and outcomes s_q [SHADOW]. Each is computed by applying the single qubit factors to psi in
+    turn, in batches of snapshots, which costs O(n 2^n) time per snapshot and O(batch_size 2^n)
+    memory.
+
+    :param data: The snapshots.
+    :param target_state: The target state vector of dimension 2^len(data.qubits), in the tensor
+        order of :py:func:`lifted_state_operator`, i.e. with data.qubits[0] the least significant
+        qubit.
+    :param n_groups: The number of groups for the median of means.
+    :param batch_size: The number of snapshots processed at once; by default such that a batch
+        takes about as much memory as 2^20 amplitudes.
+    :return: The estimated fidelity.
+    """
+    n_qubits = len(data.qubits)
+    psi = np.asarray(target_state, dtype=complex).reshape((2,) * n_qubits)
+    if batch_size is None:
+        batch_size = max(1, 2 ** 20 // 2 ** n_qubits)
+
+    paulis = np.array([np.eye(2), [[0, 1], [1, 0]], [[0, -1j], [1j, 0]], [[1, 0], [0, -1]]])
+    values = np.zeros(len(data.bases))
+    for start in range(0, len(data.bases), batch_size):
+        bases = data.bases[start:start + batch_size]
+        signs = 1 - 2 * data.outcomes[start:start + batch_size].astype(float)
+        # (batch, n_qubits, 2, 2) single qubit factors of the snapshots
+        factors = (paulis[0] + 3 * signs[..., np.newaxis, np.newaxis] * paulis[bases]) / 2
+        phi = np.broadcast_to(psi, (len(bases),) + psi.shape)
+        for idx in range(n_qubits):
+            # data.qubits[idx] is tensor factor n_qubits - 1 - idx, after the batch axis
+            axis = n_qubits - idx
+            phi = np.moveaxis(np.einsum('bij,b...j->b...i', factors[:, idx],
+                                        np.moveaxis(phi, axis, -1)), -1, axis)
+        values[start:start + batch_size] = np.real(
+            np.sum(psi.conj() * phi, axis=tuple(range(1, n_qubits + 1))))
+    return float(_median_of_means(values, n_groups))
@@ -25,8 +25,10 @@ Further references include:
        https://arxiv.org/abs/quant-ph/0401119
 
 """
+import functools
+
 import numpy as np
-from forest.benchmarking.utils import n_qubit_pauli_basis
+from forest.benchmarking.utils import n_qubit_pauli_basis, pauli_basis_traces, pauli_basis_sum
 
 
 def vec(matrix):
@@ -80,18 +82,15 @@ def kraus2superop(kraus_ops: list):
     where A^* is the complex conjugate of a matrix A, A^T is the transpose,
     and A^\dagger is the complex conjugate and transpose.
 
-    :param kraus_ops: A tuple of N Kraus operators
-    :return: Returns a D^2 x D^2 matrix.
+    :param kraus_ops: A tuple of N Kraus operators, or a (..., N, D, D) array holding a stack of
+        channels.
+    :return: Returns a D^2 x D^2 matrix, or a (..., D^2, D^2) stack.
     """
-    if not isinstance(kraus_ops, (list, tuple)):
-        kraus_ops = [kraus_ops]
-
-    dim_squared = kraus_ops[0].size
-    superop = np.zeros((dim_squared, dim_squared), dtype=complex)
-
-    for op in kraus_ops:
-        superop += np.kron(op.conj(), op)
-    return superop
+    kraus_ops = _kraus_array(kraus_ops)
+    dim = kraus_ops.shape[-1]
+    # sum_i kron(M_i^*, M_i)[(a, c), (b, d)] = sum_i M_i^*[a, b] M_i[c, d]
+    superop = np.einsum('...iab,...icd->...acbd', kraus_ops.conj(), kraus_ops)
+    return superop.reshape(kraus_ops.shape[:-3] + (dim ** 2, dim ** 2))
 
 
 def kraus2pauli_liouville(kraus_ops: list):
@@ -99,8 +98,9 @@ def kraus2pauli_liouville(kraus_ops: list):
     Convert a set of Kraus operators (representing a channel) to
     a pauli-liouville matrix.
 
-    :param kraus_ops: A list of Kraus operators
-    :return: Returns D^2 x D^2 pauli-liouville matrix
+    :param kraus_ops: A list of Kraus operators, or a (..., N, D, D) array holding a stack of
+        channels.
+    :return: Returns D^2 x D^2 pauli-liouville matrix, or a (..., D^2, D^2) stack.
     """
     return superop2pauli_liouville(kraus2superop(kraus_ops))
 
@@ -118,27 +118,34 @@ def kraus2choi(kraus_ops: list):
 
     where |M_i>> = vec(M_i)
 
-    :param kraus_ops: A list of N Kraus operators
-    :return: Returns a D^2 x D^2 matrix.
+    :param kraus_ops: A list of N Kraus operators, or a (..., N, D, D) array holding a stack of
+        channels.
+    :return: Returns a D^2 x D^2 matrix, or a (..., D^2, D^2) stack.
     """
-    if not isinstance(kraus_ops, (list, tuple)):
-        kraus_ops = [kraus_ops]
+    kraus_ops = _kraus_array(kraus_ops)
+    dim = kraus_ops.shape[-1]
+    # row i holds vec(M_i)
+    vecs = kraus_ops.swapaxes(-1, -2).reshape(kraus_ops.shape[:-2] + (dim ** 2,))
+    return np.einsum('...ia,...ib->...ab', vecs, vecs.conj())
 
-    dim_squared = kraus_ops[0].size
-    choi = np.zeros((dim_squared, dim_squared), dtype=complex)
 
-    for op in kraus_ops:
-        temp = vec(op)
-        choi += np.kron(temp, temp.conj().T)
-    return choi
+def _kraus_array(kraus_ops) -> np.ndarray:
+    """
+    Stack a single Kraus operator, a sequence of Kraus operators or a (..., N, D, D) array of
+    them into a complex (..., N, D, D) array.
+    """
+    kraus_ops = np.asarray(kraus_ops, dtype=complex)
+    if kraus_ops.ndim == 2:
+        kraus_ops = kraus_ops[np.newaxis]
+    return kraus_ops
 
 
 def superop2kraus(superop: np.ndarray):
     """
     Converts a superoperator into a list of Kraus operators. (operators with small norm may be excluded)
 
-    :param superop: a dim**2 by dim**2 superoperator
-    :return: list of Kraus operators
+    :param superop: a dim**2 by dim**2 superoperator, or a (..., dim**2, dim**2) stack
+    :return: list of Kraus operators, or a stack of them, see :py:func:`choi2kraus`
     """
     return choi2kraus(superop2choi(superop))
 
@@ -147,31 +154,32 @@ def superop2pauli_liouville(superop: np.ndarray):
     """
     Converts a superoperator into a pauli_liouville matrix. This is achieved by a linear change of basis.
 
-    :param superop: a dim**2 by dim**2 superoperator
-    :return: dim**2 by dim**2 pauli-liouville matrix
+    :param superop: a dim**2 by dim**2 superoperator, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 pauli-liouville matrix, or a stack
     """
-    dim = int(np.sqrt(superop.shape[0]))
-    c2p_basis_transform = computational2pauli_basis_matrix(dim)
-    return c2p_basis_transform @ superop @ c2p_basis_transform.conj().T * dim
+    dim = int(np.sqrt(superop.shape[-1]))
+    # c2p @ superop @ c2p^dag * dim == p2c^dag @ superop @ p2c / dim, applied factor by factor
+    return _dagger(_to_pauli_basis(_dagger(_to_pauli_basis(superop)))) / dim
 
 
 def superop2choi(superop: np.ndarray):
     """
     Convert a superoperator into a choi matrix. The operation acts equivalently to choi2superop, as it is a bijection.
 
-    :param superop: a dim**2 by dim**2 superoperator
-    :return: dim**2 by dim**2 choi matrix
+    :param superop: a dim**2 by dim**2 superoperator, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 choi matrix, or a stack
     """
-    dim = int(np.sqrt(superop.shape[0]))
-    return np.reshape(superop, [dim] * 4).swapaxes(0, 3).reshape([dim ** 2, dim ** 2])
+    dim = int(np.sqrt(superop.shape[-1]))
+    batch = superop.shape[:-2]
+    return np.reshape(superop, batch + (dim,) * 4).swapaxes(-4, -1).reshape(batch + (dim ** 2,) * 2)
 
 
 def pauli_liouville2kraus(pl_matrix: np.ndarray):
     """
     Converts a pauli_liouville matrix into a list of Kraus operators. (operators with small norm may be excluded)
 
-    :param pl_matrix: a dim**2 by dim**2 pauli_liouville matrix
-    :return: list of Kraus operators
+    :param pl_matrix: a dim**2 by dim**2 pauli_liouville matrix, or a (..., dim**2, dim**2) stack
+    :return: list of Kraus operators, or a stack of them, see :py:func:`choi2kraus`
     """
     return choi2kraus(pauli_liouville2choi(pl_matrix))
 
@@ -180,20 +188,20 @@ def pauli_liouville2superop(pl_matrix: np.ndarray):
     """
     Converts a pauli_liouville matrix into a superoperator. This is achieved by a linear change of basis.
 
-    :param pl_matrix: a dim**2 by dim**2 pauli-liouville matrix
-    :return: dim**2 by dim**2 superoperator
+    :param pl_matrix: a dim**2 by dim**2 pauli-liouville matrix, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 superoperator, or a stack
     """
-    dim = int(np.sqrt(pl_matrix.shape[0]))
-    p2c_basis_transform = pauli2computational_basis_matrix(dim)
-    return p2c_basis_transform @ pl_matrix @ p2c_basis_transform.conj().T / dim
+    dim = int(np.sqrt(pl_matrix.shape[-1]))
+    # p2c @ pl_matrix @ p2c^dag / dim, applied factor by factor
+    return _dagger(_to_computational_basis(_dagger(_to_computational_basis(pl_matrix)))) / dim
 
 
 def pauli_liouville2choi(pl_matrix: np.ndarray):
     """
     Convert a pauli-liouville matrix into a choi matrix.
 
-    :param pl_matrix: a dim**2 by dim**2 pauli-liouville matrix
-    :return: dim**2 by dim**2 choi matrix
+    :param pl_matrix: a dim**2 by dim**2 pauli-liouville matrix, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 choi matrix, or a stack
     """
     return superop2choi(pauli_liouville2superop(pl_matrix))
 
@@ -202,35 +210,79 @@ def choi2kraus(choi: np.ndarray):
     """
     Converts a choi matrix into a list of Kraus operators. (operators with small norm may be excluded)
 
-    :param choi: a dim**2 by dim**2 choi matrix
-    :return: list of Kraus operators
+    A (..., dim**2, dim**2) stack of choi matrices is decomposed with a single batched eigh. Since
+    every channel in the stack needs the same number of operators, none are excluded; the small
+    ones are set to zero instead.
+
+    :param choi: a dim**2 by dim**2 choi matrix, or a (..., dim**2, dim**2) stack
+    :return: list of Kraus operators, or a (..., dim**2, dim, dim) array of them
     """
     eigvals, v = np.linalg.eigh(choi)
-    return [np.lib.scimath.sqrt(eigval) * unvec(np.array([evec]).T) for eigval, evec in zip(eigvals, v.T) if
-            abs(eigval) > 1e-16]
+    if np.ndim(choi) == 2:
+        return [np.lib.scimath.sqrt(eigval) * unvec(np.array([evec]).T) for eigval, evec in zip(eigvals, v.T) if
+                abs(eigval) > 1e-16]
+
+    dim = int(np.sqrt(choi.shape[-1]))
+    eigvals = np.where(np.abs(eigvals) > 1e-16, eigvals, 0)
+    # operator k is unvec of eigenvector k, i.e. of column k of v
+    kraus_ops = v.swapaxes(-1, -2).reshape(v.shape[:-1] + (dim, dim)).swapaxes(-1, -2)
+    return np.lib.scimath.sqrt(eigvals)[..., np.newaxis, np.newaxis] * kraus_ops
 
 
 def choi2superop(choi: np.ndarray):
     """
     Convert a choi matrix into a superoperator. The operation acts equivalently to superop2choi, as it is a bijection.
 
-    :param choi: a dim**2 by dim**2 choi matrix
-    :return: dim**2 by dim**2 superoperator
+    :param choi: a dim**2 by dim**2 choi matrix, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 superoperator, or a stack
     """
-    dim = int(np.sqrt(choi.shape[0]))
-    return np.reshape(choi, [dim] * 4).swapaxes(0, 3).reshape([dim ** 2, dim ** 2])
+    dim = int(np.sqrt(choi.shape[-1]))
+    batch = choi.shape[:-2]
+    return np.reshape(choi, batch + (dim,) * 4).swapaxes(-4, -1).reshape(batch + (dim ** 2,) * 2)
 
 
 def choi2pauli_liouville(choi: np.ndarray):
     """
     Convert a choi matrix into a pauli-liouville matrix.
 
-    :param choi: a dim**2 by dim**2 choi matrix
-    :return: dim**2 by dim**2 pauli-liouville matrix
+    :param choi: a dim**2 by dim**2 choi matrix, or a (..., dim**2, dim**2) stack
+    :return: dim**2 by dim**2 pauli-liouville matrix, or a stack
     """
     return superop2pauli_liouville(choi2superop(choi))
 
 
+def _to_pauli_basis(matrix: np.ndarray) -> np.ndarray:
+    """
+    Compute ``pauli2computational_basis_matrix(dim).conj().T @ matrix`` without constructing the
+    basis transform.
+
+    Entry k of each transformed column |A>> is <<sigma_k|A>> = Tr[sigma_k A], which
+    :py:func:`~forest.benchmarking.utils.pauli_basis_traces` computes one tensor factor at a time,
+    so a dim^2 by dim^2 matrix costs O(n dim^4) rather than O(dim^6). Any leading dimensions are
+    treated as a batch.
+    """
+    dim = int(np.sqrt(matrix.shape[-1]))
+    # row c holds unvec of column c
+    columns = matrix.swapaxes(-1, -2).reshape(matrix.shape[:-1] + (dim, dim)).swapaxes(-1, -2)
+    return pauli_basis_traces(columns).swapaxes(-1, -2)
+
+
+def _to_computational_basis(matrix: np.ndarray) -> np.ndarray:
+    """
+    Compute ``pauli2computational_basis_matrix(dim) @ matrix`` without constructing the basis
+    transform, see :py:func:`_to_pauli_basis`. Column c is vec(sum_k matrix[k, c] sigma_k).
+    """
+    operators = pauli_basis_sum(matrix.swapaxes(-1, -2))
+    return operators.swapaxes(-1, -2).reshape(matrix.shape).swapaxes(-1, -2)
+
+
+def _dagger(matrix: np.ndarray) -> np.ndarray:
+    """
+    The conjugate transpose of a matrix, or of each matrix in a (..., N, N) stack.
+    """
+    return matrix.conj().swapaxes(-1, -2)
+
+
 def pauli2computational_basis_matrix(dim):
     """
     Produces a basis transform matrix that converts from a pauli basis to the computational basis.
@@ -239,19 +291,23 @@ def pauli2computational_basis_matrix(dim):
         sigma_x = [0, 1, 0, 0].T in the 'pauli basis'
         p2c * sigma_x = vec(sigma_x) = | sigma_x >>
 
+    The matrix is read-only, and is cached for each dimension up to 32, beyond which it takes
+    over 270 MB; the conversions in this module never need it, see :py:func:`_to_pauli_basis`.
+
     :param dim: dimension of the hilbert space on which the operators act.
     :return: A dim^2 by dim^2 basis transform matrix
     """
-    n_qubits = int(np.log2(dim))
-
-    conversion_mat = np.zeros((dim ** 2, dim ** 2), dtype=complex)
+    if dim <= _MAX_CACHED_DIM:
+        return _cached_pauli2computational_basis_matrix(dim)
+    return _pauli2computational_basis_matrix(dim)
 
-    for i, pauli in enumerate(n_qubit_pauli_basis(n_qubits)):
-        pauli_label = np.zeros((dim ** 2, 1))
-        pauli_label[i] = 1.
-        pauli_mat = pauli[1]
-        conversion_mat += np.kron(vec(pauli_mat), pauli_label.T)
 
+def _pauli2computational_basis_matrix(dim: int) -> np.ndarray:
+    n_qubits = int(np.log2(dim))
+    paulis = np.asarray(n_qubit_pauli_basis(n_qubits).ops)
+    # column k is vec(sigma_k)
+    conversion_mat = paulis.swapaxes(-1, -2).reshape(dim ** 2, dim ** 2).T.copy()
+    conversion_mat.flags.writeable = False
     return conversion_mat
 
 
@@ -264,7 +320,25 @@ def computational2pauli_basis_matrix(dim):
         vec(sigma_z) = | sigma_z >> = [1, 0, 0, -1].T in the computational basis
         c2p * | sigma_z >> = [0, 0, 0, 1].T
 
+    The matrix is read-only, and cached as for :py:func:`pauli2computational_basis_matrix`.
+
     :param dim: dimension of the hilbert space on which the operators act.
     :return: A dim^2 by dim^2 basis transform matrix
     """
-    return pauli2computational_basis_matrix(dim).conj().T / dim
+    if dim <= _MAX_CACHED_DIM:
+        return _cached_computational2pauli_basis_matrix(dim)
+    return _computational2pauli_basis_matrix(dim)
+
+
+def _computational2pauli_basis_matrix(dim: int) -> np.ndarray:
+    conversion_mat = pauli2computational_basis_matrix(dim).conj().T / dim
+    conversion_mat.flags.writeable = False
+    return conversion_mat
+
+
+# the dimension up to which the basis transform matrices, of dim^4 entries, are cached
+_MAX_CACHED_DIM = 32
+_cached_pauli2computational_basis_matrix = \
+    functools.lru_cache(maxsize=8)(_pauli2computational_basis_matrix)
+_cached_computational2pauli_basis_matrix = \
+    functools.lru_cache(maxsize=8)(_computational2pauli_basis_matrix)
@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 from requests.exceptions import RequestException
 import pytest
 from unittest.mock import create_autospec, Mock
@@ -17,6 +18,46 @@ PATH = os.path.dirname(os.path.realpath(__file__))
 RACK_YAML = os.path.join(PATH, "example_rack.yaml")
 
 
+class ClassicalQC:
+    """
+    Stands in for a QuantumComputer whose qubits always read out fixed bits, whatever the
+    program, or with a random state `rs` uniformly random bits, one per entry of `bits`. The
+    readout symmetrization of operator_estimation flips the bits as it would on a device, and a
+    symmetrization register of several flip patterns is read out as that many copies of the
+    qubits. Counts compilations and runs, and keeps the results of every run.
+    """
+
+    def __init__(self, bits, rs=None):
+        self.bits = np.asarray(bits)
+        self.rs = rs
+        self.compiler = self
+        self.compiles = 0
+        self.runs = 0
+        self.results = []
+
+    def native_quil_to_executable(self, program):
+        self.compiles += 1
+        return program
+
+    def run(self, executable, memory_map=None):
+        self.runs += 1
+        flips = None if memory_map is None else memory_map.get('ro_symmetrize')
+        width = len(self.bits) if flips is None else len(flips)
+        if self.rs is None:
+            shots = np.tile(self.bits, (executable.num_shots, width // len(self.bits)))
+        else:
+            shots = self.rs.randint(2, size=(executable.num_shots, width))
+        if flips is not None:
+            shots = shots ^ np.round(np.asarray(flips) / np.pi).astype(int)
+        self.results.append(shots)
+        return shots
+
+
+@pytest.fixture
+def classical_qc():
+    return ClassicalQC
+
+
 @pytest.fixture(scope='module')
 def qvm():
     try:
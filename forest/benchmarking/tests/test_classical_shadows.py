@@ -0,0 +1,101 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from forest.benchmarking.classical_shadows import ShadowData, generate_shadow_experiment, \
+    acquire_shadow_data, estimate_pauli_expectations, estimate_fidelity, _basis_change, \
+    _measurement_angles, _median_of_means
+from pyquil import Program
+from pyquil.gates import H, CNOT
+from pyquil.paulis import sI, sX, sY, sZ
+from pyquil.unitary_tools import lifted_pauli, program_unitary
+
+GHZ = np.zeros(8)
+GHZ[[0, 7]] = 1 / np.sqrt(2)
+
+PAULI_MATRICES = [np.eye(2), np.array([[0, 1], [1, 0]]), np.array([[0, -1j], [1j, 0]]),
+                  np.diag([1, -1])]
+
+
+def sampled_shadow_data(rho, qubits, n_shots, rs):
+    """Snapshots of rho in uniformly random Pauli bases, sampled without a QVM."""
+    n_qubits = len(qubits)
+    bases = rs.randint(1, 4, size=(n_shots, n_qubits)).astype(np.uint8)
+    outcomes = np.zeros_like(bases)
+    all_outcomes = np.array(list(itertools.product([0, 1], repeat=n_qubits)))
+    for basis in np.unique(bases, axis=0):
+        probabilities = []
+        for outcome in all_outcomes:
+            # qubits[0] is the right-most tensor factor
+            projector = np.eye(1)
+            for b, s in zip(basis, outcome):
+                projector = np.kron((np.eye(2) + (-1) ** s * PAULI_MATRICES[b]) / 2, projector)
+            probabilities.append(np.real(np.trace(projector @ rho)))
+        rows = np.all(bases == basis, axis=1)
+        samples = rs.choice(len(all_outcomes), size=np.count_nonzero(rows), p=probabilities)
+        outcomes[rows] = all_outcomes[samples]
+    return ShadowData(program=Program(), qubits=qubits, bases=bases, outcomes=outcomes)
+
+
+@pytest.fixture(scope='module')
+def ghz_shadow():
+    return sampled_shadow_data(np.outer(GHZ, GHZ), [0, 1, 2], 20_000, np.random.RandomState(52))
+
+
+def test_basis_change_diagonalizes_pauli():
+    qubits = [0, 1]
+    for ops in itertools.product([sX, sY, sZ], repeat=2):
+        out_op = ops[0](0) * ops[1](1)
+        rotation = program_unitary(_basis_change(qubits, _measurement_angles(out_op, qubits)),
+                                   n_qubits=2)
+        np.testing.assert_allclose(rotation @ lifted_pauli(out_op, qubits) @ rotation.conj().T,
+                                   lifted_pauli(sZ(0) * sZ(1), qubits), atol=1e-12)
+
+
+def test_median_of_means():
+    values = np.array([[1., 1., 5., 5., 0., 0., 9.], [0., 2., 0., 2., 0., 2., 0.]])
+    np.testing.assert_allclose(_median_of_means(values, 3), [1., 1.])
+    with pytest.raises(ValueError):
+        _median_of_means(values, 8)
+
+
+def test_pauli_expectations(ghz_shadow):
+    observables = [sI(), sZ(0) * sZ(1), sZ(1) * sZ(2), sX(0) * sX(1) * sX(2), -1 * sX(0) * sY(1) * sY(2),
+                   sZ(0), sX(1), sX(0) * sX(1)]
+    expected = [1, 1, 1, 1, 1, 0, 0, 0]
+    np.testing.assert_allclose(estimate_pauli_expectations(ghz_shadow, observables), expected,
+                               atol=0.15)
+    with pytest.raises(ValueError):
+        estimate_pauli_expectations(ghz_shadow, [1j * sZ(0) * sZ(1)])
+    with pytest.raises(ValueError):
+        estimate_pauli_expectations(ghz_shadow, [(1 + 0.5j) * sI()])
+
+
+def test_fidelity(ghz_shadow):
+    assert estimate_fidelity(ghz_shadow, GHZ) == pytest.approx(1, abs=0.1)
+    product = np.zeros(8)
+    product[0] = 1
+    assert estimate_fidelity(ghz_shadow, product) == pytest.approx(0.5, abs=0.1)
+    # batching does not change the estimate
+    assert estimate_fidelity(ghz_shadow, GHZ, batch_size=7) == \
+        pytest.approx(estimate_fidelity(ghz_shadow, GHZ))
+
+
+def test_acquire_shadow_data(classical_qc):
+    qubits = [0, 1, 2]
+    program = Program(H(0), CNOT(0, 1), CNOT(1, 2))
+    experiment = generate_shadow_experiment(program, qubits, n_bases=5,
+                                            rs=np.random.RandomState(52))
+    qc = classical_qc(bits=[1, 0, 1])
+    data = acquire_shadow_data(qc, experiment, shots_per_basis=3)
+
+    assert qc.compiles == 1
+    assert qc.runs == 5
+    assert data.bases.shape == data.outcomes.shape == (15, 3)
+    assert data.bases.dtype == data.outcomes.dtype == np.uint8
+    np.testing.assert_array_equal(data.outcomes, np.tile([1, 0, 1], (15, 1)))
+    for idx, settings in enumerate(experiment):
+        labels = [settings[0].out_operator[q] for q in qubits]
+        np.testing.assert_array_equal(data.bases[3 * idx:3 * idx + 3],
+                                      np.tile(['IXYZ'.index(l) for l in labels], (3, 1)))
@@ -6,7 +6,7 @@ from unittest.mock import Mock
 import numpy as np
 from scipy.stats import bernoulli
 from pyquil.paulis import sX, sY, sZ, sI, PauliSum, PauliTerm
-from pyquil.quil import Program
+from pyquil.quil import Program, DefGate
 from pyquil.gates import RY, RX, I
 from pyquil.api import QVMConnection
 from forest.benchmarking.operator_estimation import (remove_imaginary,
@@ -19,7 +19,16 @@ from forest.benchmarking.operator_estimation import (remove_imaginary,
                                                      diagonal_basis_commutes,
                                                      get_diagonalizing_basis,
                                                      _max_key_overlap,
-                                                     commuting_sets_by_zbasis)
+                                                     _pauli_masks,
+                                                     _mask_arrays,
+                                                     _qubitwise_conflicts,
+                                                     benchmark_grouping_strategies,
+                                                     GROUPING_STRATEGIES,
+                                                     commuting_sets_by_zbasis,
+                                                     sample_pauli_sum,
+                                                     compile_pauli_sum_estimation,
+                                                     PauliSumExecutable,
+                                                     _RunningMoments)
 
 
 def test_imaginary_removal():
@@ -91,6 +100,91 @@ def test_get_parity():
     assert np.allclose(test_parity_results, parity_results)
 
 
+def test_get_parity_matches_per_shot_sums():
+    rs = np.random.RandomState(52)
+    bitstrings = rs.randint(2, size=(1001, 6))
+    pauli_terms = [sI(0), sZ(0), sX(3) * sZ(4), sZ(2) * sY(7) * sZ(9), sZ(0) * sZ(2) * sX(3) * sZ(4)]
+    # the active qubits, in order, are 0, 2, 3, 4, 7 and 9; the identity acts on none of them
+    columns = [[], [0], [2, 3], [1, 4, 5], [0, 1, 2, 3]]
+    expected = [1 - 2 * (bitstrings[:, cols].sum(axis=1) % 2) for cols in columns]
+    for dtype in [float, np.int8]:
+        parities = get_parity(pauli_terms, bitstrings, dtype=dtype)
+        assert parities.dtype == dtype
+        np.testing.assert_array_equal(parities, expected)
+    assert get_parity(pauli_terms, []).shape == (5, 0)
+
+
+def test_running_moments_match_np_cov():
+    rs = np.random.RandomState(52)
+    samples = rs.randn(3, 100)
+    moments = _RunningMoments(3)
+    for batch in np.split(samples, [1, 7, 7, 60], axis=1):
+        moments.update(batch)
+    assert moments.n_samples == 100
+    np.testing.assert_allclose(moments.mean, samples.mean(axis=1))
+    np.testing.assert_allclose(moments.covariance(), np.cov(samples, ddof=1))
+
+    single = _RunningMoments(1)
+    single.update(samples[:1, :50])
+    single.update(samples[:1, 50:])
+    assert single.covariance().shape == np.cov(samples[0], ddof=1).shape == ()
+    np.testing.assert_allclose(single.covariance(), np.cov(samples[0], ddof=1))
+
+
+def test_sample_pauli_sum_accumulates_rounds(classical_qc):
+    pauli_terms = [sZ(0), sZ(1), sZ(0) * sZ(1)]
+    coeff_vec = np.array([[1.], [0.5], [-1.]])
+    executable = PauliSumExecutable(binary=Program().wrap_in_numshots_loop(100),
+                                    pauli_terms=pauli_terms, qubits=[0, 1], coeff_vec=coeff_vec,
+                                    variance_bound=1e-10, num_sample_ubound=450,
+                                    symmetrize=False, rand_samples=16, single_submission=False,
+                                    per_term=False)
+    qc = classical_qc(bits=[0, 0], rs=np.random.RandomState(52))
+    result = sample_pauli_sum(executable, qc)
+
+    assert qc.runs == 5
+    assert result.n_shots == 500
+    parities = get_parity(pauli_terms, np.vstack(qc.results))
+    np.testing.assert_allclose(result.pauli_expectations,
+                               coeff_vec.flatten() * parities.mean(axis=1))
+    np.testing.assert_allclose(result.expected_value, coeff_vec.T @ parities.mean(axis=1))
+    np.testing.assert_allclose(result.covariance, np.cov(parities, ddof=1))
+    np.testing.assert_allclose(result.variance,
+                               coeff_vec.T @ np.cov(parities, ddof=1) @ coeff_vec / 499)
+
+
+def test_single_submission_symmetrization(classical_qc):
+    pauli_terms = [sZ(0), sZ(1), sZ(0) * sZ(1)]
+    qc = classical_qc(bits=[1, 0])
+    executable = compile_pauli_sum_estimation(pauli_terms, {0: 'Z', 1: 'Z'}, Program(RX(np.pi, 0)),
+                                              variance_bound=1e-4, quantum_resource=qc,
+                                              rand_samples=4, single_submission=True)
+    instructions = [str(inst) for inst in executable.binary]
+    assert instructions.count('RESET') == 3
+    assert sum(inst.startswith('MEASURE') for inst in instructions) == 8
+    assert sum('ro_symmetrize[' in inst for inst in instructions) == 8
+    assert instructions.count('RX(pi) 0') == 4
+
+    result = sample_pauli_sum(executable, qc)
+    assert qc.runs == 1
+    assert result.n_shots == 4 * executable.binary.num_shots
+    np.testing.assert_allclose(result.pauli_expectations, [-1, 1, -1])
+
+    # gate definitions and declarations appear once, ahead of the repeated blocks
+    program = Program()
+    my_x = DefGate('MY_X', np.array([[0, 1], [1, 0]]))
+    program += my_x
+    program.declare('theta', 'REAL')
+    program += my_x.get_constructor()(0)
+    executable = compile_pauli_sum_estimation(pauli_terms, {0: 'Z', 1: 'Z'}, program,
+                                              variance_bound=1e-4, quantum_resource=qc,
+                                              rand_samples=4, single_submission=True)
+    assert str(executable.binary).count('DEFGATE MY_X') == 1
+    assert str(executable.binary).count('DECLARE theta') == 1
+    assert [str(inst) for inst in executable.binary].count('MY_X 0') == 4
+    assert str(Program(str(executable.binary))) == str(executable.binary)
+
+
 def test_estimate_pauli_sum(qvm):
     """
     Full test of the estimation procedures
@@ -230,6 +324,67 @@ def test_max_key_overlap():
     assert _max_key_overlap(x0_term, diag_sets) == d_expected
 
 
+def test_pauli_masks():
+    qubit_bits = {}
+    assert _pauli_masks(sX(3) * sY(0) * sZ(7), qubit_bits) == (0b011, 0b110)
+    assert qubit_bits == {3: 0, 0: 1, 7: 2}
+    assert _pauli_masks(sZ(3) * sX(5), qubit_bits) == (0b1000, 0b0001)
+    assert _pauli_masks(sI(0), qubit_bits) == (0, 0)
+
+
+def test_commuting_sets_by_zbasis_matches_max_key_overlap():
+    rs = np.random.RandomState(24)
+    terms = []
+    for _ in range(300):
+        qubits = rs.choice(8, rs.randint(5), replace=False)
+        terms.append(PauliTerm.from_list([(rs.choice(list('XYZ')), int(q)) for q in qubits],
+                                         coefficient=rs.rand()))
+    expected = {}
+    for term in terms:
+        expected = _max_key_overlap(term, expected)
+    result = commuting_sets_by_zbasis(terms)
+    assert list(result.keys()) == list(expected.keys())
+    for key, pset in expected.items():
+        assert [id(term) for term in result[key]] == [id(term) for term in pset]
+
+
+def test_grouping_strategies():
+    rs = np.random.RandomState(25)
+    terms = []
+    for _ in range(200):
+        qubits = rs.choice(70, rs.randint(1, 5), replace=False)
+        terms.append(PauliTerm.from_list([(rs.choice(list('XYZ')), int(q)) for q in qubits],
+                                         coefficient=rs.randn()))
+
+    x_masks, z_masks = _mask_arrays(terms)
+    assert x_masks.shape == (200, 2)
+    conflicts = _qubitwise_conflicts(x_masks, z_masks, slice(0, 20))
+    for row, term_a in enumerate(terms[:20]):
+        for col, term_b in enumerate(terms):
+            assert conflicts[row, col] != diagonal_basis_commutes(term_a, term_b)
+
+    benchmarks = benchmark_grouping_strategies(terms)
+    assert [b.strategy for b in benchmarks] == list(GROUPING_STRATEGIES)
+    n_groups = {b.strategy: b.n_groups for b in benchmarks}
+    assert n_groups['dsatur'] < n_groups['first_fit']
+    for strategy in GROUPING_STRATEGIES:
+        # each strategy places every term once, in a set checked to share a diagonal basis
+        psets = commuting_sets_by_zbasis(terms, strategy)
+        assert len(psets) == n_groups[strategy]
+        assert sorted(id(term) for pset in psets.values() for term in pset) == \
+            sorted(id(term) for term in terms)
+
+    # custom strategies, with sets sharing a basis merged
+    psets = commuting_sets_by_zbasis([sZ(0), 0.5 * sZ(0), sX(0)], lambda terms: [[0], [1], [2]])
+    assert psets == {((0, 'Z'),): [sZ(0), 0.5 * sZ(0)], ((0, 'X'),): [sX(0)]}
+    with pytest.raises(CommutationError):
+        commuting_sets_by_zbasis(sZ(0) + sX(0), lambda terms: [[0, 1]])
+    with pytest.raises(ValueError):
+        commuting_sets_by_zbasis(sZ(0) + sX(0), lambda terms: [[0]])
+    with pytest.raises(ValueError):
+        commuting_sets_by_zbasis(sZ(0), 'random')
+
+
 def test_commuting_sets_by_zbasis():
     # complicated coefficients, overlap on single qubit
     coeff1 = 0.012870253243021476
@@ -8,8 +8,10 @@ from forest.benchmarking.compilation import basic_compile
 from forest.benchmarking.random_operators import haar_rand_unitary
 from forest.benchmarking.superoperator_conversion import vec, unvec, kraus2choi
 from forest.benchmarking.tomography import proj_to_cp, proj_to_tni, \
-    generate_process_tomography_experiment, pgdb_process_estimate, proj_to_tp, _constraint_project
-from forest.benchmarking.utils import sigma_x, partial_trace
+    generate_process_tomography_experiment, pgdb_process_estimate, proj_to_tp, _constraint_project, \
+    ProcessMeasurementOperator, acquire_tomography_data, ConvergenceTrace
+from forest.benchmarking.tomography import TomographyExperiment as ForestTomographyExperiment
+from forest.benchmarking.utils import sigma_x, partial_trace, all_sic_terms, all_pauli_terms
 from pyquil import Program
 from pyquil import gate_matrices as mat
 from pyquil.api import QVM
@@ -17,6 +19,7 @@ from pyquil.gates import CNOT, X
 from pyquil.numpy_simulator import NumpyWavefunctionSimulator
 from pyquil.operator_estimation import measure_observables, ExperimentResult, TomographyExperiment, \
     _one_q_state_prep
+from pyquil.unitary_tools import lifted_pauli, lifted_state_operator
 
 
 def test_proj_to_cp():
@@ -49,6 +52,26 @@ def test_proj_to_tp():
     assert np.allclose(state, proj_to_tp(state))
 
 
+@pytest.mark.parametrize('dim', [2, 4])
+def test_proj_to_tp_matches_explicit_partial_trace_matrix(dim):
+    rs = np.random.RandomState(52)
+    state = vec(rs.randn(dim ** 2, dim ** 2) + 1j * rs.randn(dim ** 2, dim ** 2))
+
+    # Equation 13 of [PGD] with M built explicitly
+    M = np.zeros((dim ** 2, dim ** 4))
+    for i in range(dim):
+        e = np.zeros((dim, 1))
+        e[i] = 1
+        B = np.kron(np.eye(dim), e.T)
+        M = M + np.kron(B, B)
+    expected = state + 1 / dim * (M.T @ vec(np.eye(dim)) - M.T @ M @ state)
+
+    projected = proj_to_tp(state)
+    np.testing.assert_allclose(projected, expected, atol=1e-12)
+    np.testing.assert_allclose(partial_trace(unvec(projected), dims=[dim, dim], keep=[0]),
+                               np.eye(dim), atol=1e-12)
+
+
 def test_cptp():
     # Identity process is cptp, so no change
     state = np.array(kraus2choi(np.eye(2)))
@@ -191,3 +214,112 @@ def test_two_q_pgdb(two_q_tomo_fixture):
     process_choi_est = pgdb_process_estimate(results, qubits=qubits)
     process_choi_true = kraus2choi(u_rand)
     np.testing.assert_allclose(process_choi_true, process_choi_est, atol=0.05)
+
+
+def exact_process_results(unitary, qubits, in_basis):
+    """Process tomography results whose expectations are computed exactly from the unitary."""
+    tomo_expt = generate_process_tomography_experiment(Program(), qubits, in_basis=in_basis)
+    results = []
+    for settings in tomo_expt:
+        for setting in settings:
+            # the unitary follows the pyquil gate convention, i.e. qubits[0] is left-most
+            in_state = lifted_state_operator(setting.in_state, qubits=qubits[::-1])
+            out_op = lifted_pauli(setting.out_operator, qubits=qubits[::-1])
+            expectation = np.trace(out_op @ unitary @ in_state @ unitary.conj().T)
+            results.append(ExperimentResult(setting=setting, expectation=np.real(expectation),
+                                            stddev=0., total_counts=1))
+    return results
+
+
+def test_process_measurement_operator_matches_dense(basis):
+    qubits = [0, 1]
+    dim = 4
+    results = exact_process_results(mat.CNOT, qubits, basis)
+    A = ProcessMeasurementOperator(results, qubits)
+
+    dense_rows = []
+    for result in results:
+        in_state = lifted_state_operator(result.setting.in_state, qubits=qubits)
+        out_op = lifted_pauli(result.setting.out_operator, qubits=qubits)
+        for sign in [1, -1]:
+            proj = (np.eye(dim) + sign * out_op) / 2
+            dense_rows.append(vec(np.kron(in_state, proj.T)).T[0] / dim ** 2)
+    dense_A = np.asarray(dense_rows)
+    assert A.shape == dense_A.shape
+
+    rs = np.random.RandomState(52)
+    choi_vec = rs.randn(dim ** 4, 1) + 1j * rs.randn(dim ** 4, 1)
+    weights = rs.randn(A.shape[0], 1) + 1j * rs.randn(A.shape[0], 1)
+    np.testing.assert_allclose(A @ choi_vec, dense_A @ choi_vec, atol=1e-12)
+    np.testing.assert_allclose(A.H @ weights, dense_A.conj().T @ weights, atol=1e-12)
+
+
+def test_two_q_pgdb_exact_data(basis):
+    qubits = [0, 1]
+    u_rand = haar_rand_unitary(2 ** 2, rs=np.random.RandomState(52))
+    results = exact_process_results(u_rand, qubits, basis)
+    process_choi_est = pgdb_process_estimate(results, qubits=qubits)
+    np.testing.assert_allclose(kraus2choi(u_rand), process_choi_est, atol=0.05)
+
+
+def test_accelerated_pgdb_matches_plain(basis):
+    qubits = [0, 1]
+    u_rand = haar_rand_unitary(2 ** 2, rs=np.random.RandomState(52))
+    results = exact_process_results(u_rand, qubits, basis)
+
+    plain_est, plain_stats = pgdb_process_estimate(results, qubits=qubits, full_output=True)
+    fast_est, fast_stats = pgdb_process_estimate(results, qubits=qubits, accelerated=True,
+                                                 full_output=True)
+    assert plain_stats.restarts == 0
+    assert fast_stats.iterations < plain_stats.iterations
+    assert fast_stats.final_cost <= plain_stats.final_cost + 1e-6
+    np.testing.assert_allclose(plain_est, pgdb_process_estimate(results, qubits=qubits))
+    np.testing.assert_allclose(fast_est, plain_est, atol=0.05)
+    np.testing.assert_allclose(kraus2choi(u_rand), fast_est, atol=0.05)
+
+
+def test_pgdb_callback_and_budget():
+    qubits = [0, 1]
+    u_rand = haar_rand_unitary(2 ** 2, rs=np.random.RandomState(52))
+    results = exact_process_results(u_rand, qubits, 'sic')
+
+    trace = ConvergenceTrace()
+    est, stats = pgdb_process_estimate(results, qubits=qubits, full_output=True, callback=trace)
+    assert stats.status == 'optimal'
+    assert len(trace) == stats.iterations
+    assert np.all(np.diff(trace.costs) <= 0)
+    assert trace.costs[-1] == pytest.approx(stats.final_cost)
+    assert trace.stalled(window=1) and not trace.stalled(window=len(trace) - 1)
+    assert not ConvergenceTrace().stalled()
+
+    _, stats = pgdb_process_estimate(results, qubits=qubits, full_output=True, maxiter=3)
+    assert stats.status == 'maxiter'
+    assert stats.iterations == 3
+    _, stats = pgdb_process_estimate(results, qubits=qubits, full_output=True, max_time=0.)
+    assert stats.status == 'maxtime'
+    assert stats.iterations == 0
+
+
+def test_constraint_project_callback():
+    state = vec(np.diag([1.2, -0.1, 0.3, -0.4]))
+    trace = ConvergenceTrace()
+    projected = _constraint_project(unvec(state), callback=trace)
+    assert trace.costs[-1] < 1e-4
+    assert np.all(trace.costs[:-1] >= 1e-4)
+    projected_once = _constraint_project(unvec(state), maxiter=1)
+    assert not np.allclose(projected, projected_once)
+
+
+def test_acquire_process_data_compiles_each_basis_once(classical_qc):
+    in_ops = all_sic_terms(2, [0, 1])
+    out_ops = all_pauli_terms(2, [0, 1])
+    experiment = ForestTomographyExperiment(in_ops=in_ops, program=Program(CNOT(0, 1)),
+                                            out_ops=out_ops)
+    qc = classical_qc(bits=[1, 0])
+    data = acquire_tomography_data(experiment, qc, var=0.01)
+
+    # input states are swept through the memory map of one executable per measurement basis
+    assert qc.compiles == 3 ** 2
+    assert qc.runs == 3 ** 2 * len(in_ops)
+    expected = [(-1) ** sum(qc.bits[q] for q in op.get_qubits()) for op in out_ops]
+    np.testing.assert_allclose(data.expectations, np.tile(expected, len(in_ops)))
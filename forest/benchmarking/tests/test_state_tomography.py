@@ -1,3 +1,5 @@
+from dataclasses import replace
+
 import networkx as nx
 import numpy as np
 import pytest
@@ -6,15 +8,24 @@ from forest.benchmarking.compilation import basic_compile
 from forest.benchmarking.random_operators import haar_rand_unitary
 from forest.benchmarking.tomography import generate_state_tomography_experiment, _R, \
     iterative_mle_state_estimate, project_density_matrix, estimate_variance, \
-    linear_inv_state_estimate
+    linear_inv_state_estimate, construct_projection_operators_on_n_qubits, PauliProjectionOperators, \
+    batch_iterative_mle_state_estimate, ExperimentResultArrays, TomographyExperiment, \
+    acquire_tomography_data, StreamingStateTomography, _pauli_action, low_rank_state_estimate, \
+    generate_random_state_tomography_experiment, ConvergenceTrace
+from forest.benchmarking.superoperator_conversion import vec, unvec
+from forest.benchmarking.utils import n_qubit_pauli_basis, all_pauli_terms
 from pyquil.api import ForestConnection, QuantumComputer, QVM
 from pyquil.api._compiler import _extract_attribute_dictionary_from_program
 from pyquil.api._qac import AbstractCompiler
 from pyquil.device import NxDevice
 from pyquil.gates import I, H, CZ
+from pyquil.paulis import sX, sZ, is_identity
 from pyquil.numpy_simulator import NumpyWavefunctionSimulator
-from pyquil.operator_estimation import measure_observables
+from pyquil.operator_estimation import measure_observables, ExperimentResult
+from pyquil.operator_estimation import ExperimentSetting
 from pyquil.quil import Program
+from pyquil.unitary_tools import lifted_pauli
+from scipy.linalg import logm, pinv
 from rpcq.messages import PyQuilExecutableResponse
 
 from forest.benchmarking import distance_measures as dm
@@ -38,6 +49,19 @@ P10 = np.kron(PROJ_ONE, PROJ_ZERO)
 P11 = np.kron(PROJ_ONE, PROJ_ONE)
 ID_2Q = P00 + P01 + P10 + P11
 ZZ_EFFECTS = [P00, P01, P10, P11]
+BELL = np.array([[1], [0], [0], [1]]) / np.sqrt(2)
+NOISY_BELL = 0.9 * BELL @ BELL.T.conj() + 0.1 * ID_2Q / 4
+
+
+def exact_results(rho, qubits, n_shots=10_000):
+    """State tomography results whose expectations are computed exactly from rho."""
+    tomo_expt = generate_state_tomography_experiment(Program(), qubits)
+    return [ExperimentResult(setting=setting,
+                             expectation=np.real(np.trace(rho @ lifted_pauli(setting.out_operator,
+                                                                             qubits))),
+                             stddev=0.,
+                             total_counts=n_shots)
+            for settings in tomo_expt for setting in settings]
 
 
 def test_generate_1q_state_tomography_experiment():
@@ -96,6 +120,161 @@ def test_R_operator_fixed_point_2_qubit():
     np.testing.assert_allclose(actual, 0.0, atol=1e-12)
 
 
+def test_projection_operators_are_stacked():
+    effects = construct_projection_operators_on_n_qubits(2)
+    assert effects.shape == (30, 4, 4)
+    # each pair of effects is a two outcome POVM
+    np.testing.assert_allclose(effects[0::2] + effects[1::2], np.broadcast_to(ID_2Q, (15, 4, 4)))
+    paulis = n_qubit_pauli_basis(2).ops[1:]
+    np.testing.assert_allclose(effects[0::2] - effects[1::2], paulis)
+
+
+def test_R_operator_stacked_matches_sum():
+    effects = construct_projection_operators_on_n_qubits(2)
+    freqs = np.random.RandomState(52).randint(1, 100, size=len(effects))
+    expected = sum(effect * freq / np.real(np.trace(NOISY_BELL @ effect))
+                   for effect, freq in zip(effects, freqs))
+    np.testing.assert_allclose(_R(NOISY_BELL, effects, freqs), expected, atol=1e-12)
+
+
+def test_matrix_free_projection_operators():
+    n_qubits = 3
+    dense = construct_projection_operators_on_n_qubits(n_qubits)
+    matrix_free = PauliProjectionOperators(n_qubits)
+    assert len(matrix_free) == len(dense)
+    np.testing.assert_allclose(matrix_free[5], dense[5])
+    np.testing.assert_allclose(matrix_free[-1], dense[-1])
+
+    rs = np.random.RandomState(52)
+    psi = rs.randn(8, 1) + 1j * rs.randn(8, 1)
+    rho = psi @ psi.T.conj() / np.linalg.norm(psi) ** 2
+    freqs = rs.randint(1, 100, size=len(dense))
+    np.testing.assert_allclose(matrix_free.probabilities(rho),
+                               [np.real(np.trace(rho @ effect)) for effect in dense], atol=1e-12)
+    np.testing.assert_allclose(_R(rho, matrix_free, freqs), _R(rho, dense, freqs), atol=1e-10)
+
+
+def test_two_qubit_mle_exact_data():
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits)
+    estimate, status = iterative_mle_state_estimate(results=results, qubits=qubits, dilution=0.5)
+    np.testing.assert_allclose(NOISY_BELL, estimate.estimate.state_point_est, atol=1e-3)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'beta': 0.5}, {'entropy_penalty': 1.0, 'tol': 1e-5}])
+def test_batch_mle_matches_single(kwargs):
+    qubits = [0, 1]
+    batch = [exact_results(NOISY_BELL, qubits), exact_results(ID_2Q / 4, qubits, n_shots=500)]
+    batch_estimates = batch_iterative_mle_state_estimate(batch, qubits, dilution=0.5, **kwargs)
+    assert len(batch_estimates) == 2
+    for results, (batch_estimate, batch_status) in zip(batch, batch_estimates):
+        estimate, status = iterative_mle_state_estimate(results, qubits, dilution=0.5, **kwargs)
+        assert batch_status == status
+        np.testing.assert_allclose(batch_estimate.estimate.state_point_est,
+                                   estimate.estimate.state_point_est, atol=1e-8)
+        np.testing.assert_allclose(batch_estimate.estimate.loglike, estimate.estimate.loglike)
+
+
+def _reference_mle_update(rho, projectors, freq, dilution, entropy_penalty, beta, num_meas):
+    """One diluted MLE update with dense projectors and scipy's logm and pinv."""
+    dim = len(rho)
+    R = sum(f / np.real(np.trace(proj @ rho)) * proj for f, proj in zip(freq, projectors))
+    Tk = R - np.eye(dim)
+    if entropy_penalty > 0.0:
+        log_rho = logm(rho)
+        Tk -= entropy_penalty * (log_rho - np.eye(dim) * np.trace(rho @ log_rho))
+    if beta > 0.0:
+        Tk = beta * (pinv(rho) - dim * np.eye(dim)) + num_meas * (R - np.eye(dim))
+    update_map = np.eye(dim) + Tk / dilution
+    rho = update_map @ rho @ update_map
+    return rho / np.trace(rho)
+
+
+@pytest.mark.parametrize('kwargs', [{'entropy_penalty': 0.05}, {'beta': 0.5}])
+def test_mle_update_matches_reference(kwargs):
+    qubits = [0, 1]
+    rs = np.random.RandomState(15)
+    psi = haar_rand_unitary(4, rs=rs)[:, :1]
+    rho_true = 0.8 * psi @ psi.conj().T + 0.2 * ID_2Q / 4
+    n_shots = 1000
+    results = []
+    for result in exact_results(rho_true, qubits, n_shots=n_shots):
+        n_plus = rs.binomial(n_shots, (1 + result.expectation) / 2)
+        results.append(ExperimentResult(setting=result.setting,
+                                        expectation=2 * n_plus / n_shots - 1,
+                                        stddev=0., total_counts=n_shots))
+
+    projectors = []
+    freq = []
+    # the estimators skip the leading identity setting, and kron the qubits with qubits[0] most
+    # significant
+    for result in results[1:]:
+        pauli = lifted_pauli(result.setting.out_operator, qubits[::-1])
+        projectors += [(ID_2Q + pauli) / 2, (ID_2Q - pauli) / 2]
+        n_plus = int((result.expectation + 1) / 2 * n_shots)
+        freq += [n_plus, n_shots - n_plus]
+
+    n_updates = 20
+    rho = ID_2Q / 4
+    for _ in range(n_updates):
+        rho = _reference_mle_update(rho, projectors, freq, dilution=0.5,
+                                    num_meas=n_shots * (len(results) - 1),
+                                    **dict({'entropy_penalty': 0.0, 'beta': 0.0}, **kwargs))
+
+    estimate, status = iterative_mle_state_estimate(results, qubits, dilution=0.5, tol=0.,
+                                                    maxiter=n_updates + 1, **kwargs)
+    assert status == 'maxiter'
+    np.testing.assert_allclose(estimate.estimate.state_point_est, rho, atol=1e-10)
+    [(estimate, status)] = batch_iterative_mle_state_estimate([results], qubits, dilution=0.5,
+                                                              tol=0., maxiter=n_updates + 1,
+                                                              **kwargs)
+    assert status == 'maxiter'
+    np.testing.assert_allclose(estimate.estimate.state_point_est, rho, atol=1e-10)
+
+
+def test_batch_mle_requires_same_settings():
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits)
+    with pytest.raises(ValueError):
+        batch_iterative_mle_state_estimate([results, results[::-1]], qubits)
+
+
+def test_mle_callback_and_budget():
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits)
+    trace = ConvergenceTrace(keep_estimates=True)
+    estimate, status = iterative_mle_state_estimate(results, qubits, dilution=0.5,
+                                                    entropy_penalty=0.05, tol=1e-6, callback=trace)
+    assert status == 'optimal'
+    np.testing.assert_array_equal(trace.iterations, np.arange(1, len(trace) + 1))
+    assert np.all(np.diff(trace.elapsed) >= 0)
+    assert trace.step_sizes[-1] < 1e-6
+    np.testing.assert_allclose(trace.estimates[-1], estimate.estimate.state_point_est)
+    assert trace.costs[-1] == pytest.approx(-estimate.estimate.loglike)
+
+    trace = ConvergenceTrace()
+    _, status = iterative_mle_state_estimate(results, qubits, dilution=0.5, maxiter=5,
+                                             callback=trace)
+    assert status == 'maxiter'
+    assert len(trace) == 4
+    _, status = iterative_mle_state_estimate(results, qubits, max_time=0.)
+    assert status == 'maxtime'
+
+    batch = [results, exact_results(ID_2Q / 4, qubits)]
+    trace = ConvergenceTrace(keep_estimates=True)
+    estimates = batch_iterative_mle_state_estimate(batch, qubits, dilution=0.5, tol=1e-6,
+                                                   callback=trace)
+    assert [status for _, status in estimates] == ['optimal', 'optimal']
+    assert trace.step_sizes[-1] < 1e-6
+    assert trace.estimates[-1].shape == (2, 4, 4)
+    assert trace.costs[-1] == pytest.approx(-sum(est.estimate.loglike for est, _ in estimates))
+    estimates = batch_iterative_mle_state_estimate(batch, qubits, dilution=0.5, maxiter=5)
+    # the maximally mixed state is the fixed point it starts from
+    assert [status for _, status in estimates] == ['maxiter', 'optimal']
+    estimates = batch_iterative_mle_state_estimate(batch, qubits, max_time=0.)
+    assert [status for _, status in estimates] == ['maxtime', 'maxtime']
+
+
 def get_test_qc(n_qubits):
     class BasicQVMCompiler(AbstractCompiler):
         def quil_to_native_quil(self, program: Program):
@@ -244,6 +423,19 @@ def test_project_density_matrix():
     assert np.allclose(phys, np.diag([0, 0, 1.0 / 5, 7.0 / 20, 9.0 / 20]))
 
 
+def test_project_density_matrix_batch():
+    rs = np.random.RandomState(52)
+    matrices = rs.normal(size=(20, 4, 4)) + 1j * rs.normal(size=(20, 4, 4))
+    hermitian = matrices + matrices.conj().swapaxes(-1, -2) + 4 * np.eye(4)
+    hermitian[::2] = hermitian[::2] @ hermitian[::2]  # some are already physical
+    projected = project_density_matrix(hermitian)
+    assert projected.shape == (20, 4, 4)
+    for matrix, proj in zip(hermitian, projected):
+        np.testing.assert_allclose(proj, project_density_matrix(matrix), atol=1e-12)
+        assert np.trace(proj) == pytest.approx(1)
+        assert np.min(np.linalg.eigvalsh(proj)) >= -1e-12
+
+
 def test_variance_bootstrap():
     qubits = [0, 1]
     qc = get_test_qc(n_qubits=len(qubits))
@@ -267,3 +459,188 @@ def test_variance_bootstrap():
                                               n_resamples=5, project_to_physical=False)
 
     np.testing.assert_allclose(purity, boot_purity, atol=2 * np.sqrt(boot_var), rtol=0.01)
+
+
+def _mle_estimator(results, qubits):
+    return iterative_mle_state_estimate(results=results, qubits=qubits, dilution=0.5)[0]
+
+
+@pytest.mark.parametrize('tomo_estimator', [linear_inv_state_estimate, _mle_estimator])
+def test_variance_bootstrap_is_reproducible(tomo_estimator):
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits, n_shots=4000)
+    serial = estimate_variance(results=results, qubits=qubits, tomo_estimator=tomo_estimator,
+                               functional=dm.purity, n_resamples=8, seed=52)
+    assert serial == estimate_variance(results=results, qubits=qubits,
+                                       tomo_estimator=tomo_estimator, functional=dm.purity,
+                                       n_resamples=8, seed=52)
+    parallel = estimate_variance(results=results, qubits=qubits, tomo_estimator=tomo_estimator,
+                                 functional=dm.purity, n_resamples=8, seed=52, n_jobs=2)
+    np.testing.assert_allclose(serial, parallel)
+    purity = np.real(np.trace(NOISY_BELL @ NOISY_BELL))
+    np.testing.assert_allclose(purity, serial[0], atol=5 * np.sqrt(serial[1]))
+
+
+def test_result_arrays():
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits)
+    result_arrays = ExperimentResultArrays.from_results(results)
+    assert len(result_arrays) == len(results)
+    assert result_arrays[3].setting == results[3].setting
+    assert result_arrays[3].expectation == results[3].expectation
+    assert [r.total_counts for r in result_arrays[1:]] == [r.total_counts for r in results[1:]]
+
+    rho = linear_inv_state_estimate(result_arrays, qubits)
+    np.testing.assert_allclose(rho, NOISY_BELL, atol=1e-12)
+
+    mixed = exact_results(ID_2Q / 4, qubits)
+    stacked = replace(result_arrays, expectations=np.array([[r.expectation for r in results],
+                                                            [r.expectation for r in mixed]]))
+    rhos = linear_inv_state_estimate(stacked, qubits)
+    np.testing.assert_allclose(rhos, [NOISY_BELL, ID_2Q / 4], atol=1e-12)
+
+
+def test_linear_inv_matches_pseudo_inverse():
+    qubits = [3, 1]
+    rs = np.random.RandomState(52)
+    mat = rs.randn(4, 4) + 1j * rs.randn(4, 4)
+    rho = mat @ mat.T.conj() / np.trace(mat @ mat.T.conj())
+    results = exact_results(rho, qubits)
+    np.testing.assert_allclose(linear_inv_state_estimate(results, qubits), rho, atol=1e-12)
+
+    def pinv_estimate(_results):
+        measurement_matrix = np.vstack([
+            vec(lifted_pauli(result.setting.out_operator, qubits=qubits)).T.conj()
+            for result in _results])
+        return unvec(pinv(measurement_matrix) @ np.array([r.expectation for r in _results]))
+
+    # an incomplete set of settings, one with a non-unit coefficient
+    scaled = ExperimentSetting(in_state=results[6].setting.in_state,
+                               out_operator=-2 * results[6].setting.out_operator)
+    partial = results[:6] + [ExperimentResult(setting=scaled, expectation=-2 * results[6].expectation,
+                                              stddev=0., total_counts=1)]
+    np.testing.assert_allclose(linear_inv_state_estimate(partial, qubits), pinv_estimate(partial),
+                               atol=1e-12)
+
+    # a repeated setting falls back to least squares
+    repeated = results + [ExperimentResult(setting=results[5].setting,
+                                           expectation=results[5].expectation + 0.1,
+                                           stddev=0., total_counts=1)]
+    np.testing.assert_allclose(linear_inv_state_estimate(repeated, qubits),
+                               pinv_estimate(repeated), atol=1e-12)
+
+
+def test_acquire_tomography_data_groups_settings(classical_qc):
+    qubits = [0, 1]
+    out_ops = [setting.out_operator for settings in
+               generate_state_tomography_experiment(Program(), qubits) for setting in settings]
+    experiment = TomographyExperiment(in_ops=None, program=Program(I(0), I(1)), out_ops=out_ops)
+    qc = classical_qc(bits=[0, 1])
+    data = acquire_tomography_data(experiment, qc, var=0.01)
+
+    # one run per local measurement basis rather than per Pauli operator
+    assert qc.runs == 3 ** 2
+    assert len(data.expectations) == len(out_ops)
+    # the readout ignores the basis rotations, so each Pauli reports the parity of its support
+    expected = [(-1) ** sum(qc.bits[q] for q in op.get_qubits()) for op in out_ops]
+    np.testing.assert_allclose(data.expectations, expected)
+    np.testing.assert_allclose(data.variances, 0)
+    assert data.counts[0] == 0  # the identity is not measured
+    assert all(count == data.counts[1] > 0 for count in data.counts[1:])
+
+
+def test_acquire_tomography_data_variance_per_observable(classical_qc):
+    qubits = [0, 1]
+    out_ops = [setting.out_operator for settings in
+               generate_state_tomography_experiment(Program(), qubits) for setting in settings]
+    experiment = TomographyExperiment(in_ops=None, program=Program(I(0), I(1)), out_ops=out_ops)
+    qc = classical_qc(bits=[0, 0], rs=np.random.RandomState(10))
+    var = 2e-5
+    data = acquire_tomography_data(experiment, qc, var=var)
+
+    # each set of 3 Paulis needs several rounds before all of their variances are within var
+    assert qc.runs > 3 ** 2
+    assert max(data.variances) <= var
+    assert all(count >= 1 / var for count in data.counts[1:])
+
+
+def test_streaming_tomography():
+    qubits = [0, 1]
+    results = exact_results(NOISY_BELL, qubits, n_shots=2_000)
+    stream = StreamingStateTomography(qubits)
+    # data arriving in two batches of half the shots, in reverse order of settings
+    for _ in range(2):
+        stream.add_results([replace(result, total_counts=1_000) for result in results[::-1]])
+
+    np.testing.assert_allclose(stream.linear_inv_estimate(),
+                               linear_inv_state_estimate(results, qubits), atol=1e-12)
+
+    cold_estimate, _ = iterative_mle_state_estimate(results, qubits, tol=1e-12)
+    stream.mle_estimate(tol=1e-12)
+    stream.add_results(results)
+    warm_estimate, status = stream.mle_estimate(tol=1e-12)
+    assert status == 'optimal'
+    np.testing.assert_allclose(warm_estimate.estimate.state_point_est,
+                               cold_estimate.estimate.state_point_est, atol=1e-4)
+
+
+def test_streaming_tomography_bitstrings():
+    qubits = [0, 1]
+    stream = StreamingStateTomography(qubits)
+    # 3 of 4 shots have even parity on both qubits, 1 of 4 has qubit 1 flipped
+    bitstrings = np.array([[0, 0], [1, 1], [0, 0], [0, 1]])
+    stream.add_bitstrings([sZ(0), sZ(1), sZ(0) * sZ(1)], bitstrings)
+    stream.add_bitstrings([sX(1)], np.zeros((10, 2), dtype=int))
+
+    arrays = stream.result_arrays()
+    expected = {'ZI': 0.5, 'IZ': 0., 'ZZ': 0.5, 'IX': 1.}
+    for setting, expectation, count in zip(arrays.settings, arrays.expectations, arrays.counts):
+        label = ''.join(setting.out_operator[q] for q in qubits)
+        assert expectation == expected.get(label, 1. if label == 'II' else 0.)
+        assert count == {'IX': 10}.get(label, 4 if label in expected else 0)
+
+
+def test_pauli_action_matches_lifted_pauli():
+    qubits = [3, 1]
+    index = np.arange(4)
+    parity = (index & 1) ^ (index >> 1)
+    vector = np.random.RandomState(52).normal(size=4) + 0j
+    for term in all_pauli_terms(2, qubits):
+        permutation, phases = _pauli_action(term, qubits, parity)
+        np.testing.assert_allclose(phases * vector[permutation],
+                                   lifted_pauli(term, qubits) @ vector, atol=1e-12)
+
+
+def test_low_rank_state_estimate():
+    qubits = [0, 1, 2, 3]
+    rs = np.random.RandomState(52)
+    psi = haar_rand_unitary(16, rs=rs)[:, 0]
+    experiment = generate_random_state_tomography_experiment(Program(), qubits, n_settings=100,
+                                                             rs=rs)
+    out_ops = [setting.out_operator for settings in experiment for setting in settings]
+    assert len(set(str(op) for op in out_ops)) == 100
+    assert not any(is_identity(op) for op in out_ops)
+
+    results = [ExperimentResult(setting=setting,
+                                expectation=np.real(psi.conj() @ lifted_pauli(setting.out_operator,
+                                                                              qubits) @ psi),
+                                stddev=0., total_counts=10_000)
+               for settings in experiment for setting in settings]
+    factor, status = low_rank_state_estimate(results, qubits, rank=1, rs=rs)
+    assert status == 'optimal'
+    assert factor.shape == (16, 1)
+    assert np.abs(psi.conj() @ factor[:, 0]) ** 2 == pytest.approx(1, abs=1e-6)
+
+    _, status = low_rank_state_estimate(results, qubits, rank=1, maxiter=2, rs=rs)
+    assert status == 'maxiter'
+    trace = ConvergenceTrace()
+    factor, status = low_rank_state_estimate(results, qubits, rank=1, max_time=0., rs=rs,
+                                             callback=trace)
+    assert status == 'maxtime'
+    assert len(trace) == 1 and factor.shape == (16, 1)
+    trace = ConvergenceTrace(keep_estimates=True)
+    factor, _ = low_rank_state_estimate(results, qubits, rank=1, rs=rs, callback=trace)
+    np.testing.assert_array_equal(trace.iterations, np.arange(1, len(trace) + 1))
+    assert trace.costs[-1] < 1e-10
+    np.testing.assert_allclose(trace.estimates[-1], factor)
+
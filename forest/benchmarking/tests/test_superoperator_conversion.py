@@ -84,6 +84,35 @@ def test_basis_transform_c_to_p():
     assert np.allclose(computational2pauli_basis_matrix(4) @ vec(np.kron(sigma_x, sigma_z)), xz_pauli_basis)
 
 
+def test_basis_transforms_are_cached():
+    assert pauli2computational_basis_matrix(4) is pauli2computational_basis_matrix(4)
+    assert not computational2pauli_basis_matrix(4).flags.writeable
+    np.testing.assert_allclose(computational2pauli_basis_matrix(4),
+                               pauli2computational_basis_matrix(4).conj().T / 4)
+
+
+def test_large_basis_transforms_are_not_cached(monkeypatch):
+    import forest.benchmarking.superoperator_conversion as conversion
+    monkeypatch.setattr(conversion, '_MAX_CACHED_DIM', 2)
+    assert pauli2computational_basis_matrix(2) is pauli2computational_basis_matrix(2)
+    assert pauli2computational_basis_matrix(4) is not pauli2computational_basis_matrix(4)
+    assert computational2pauli_basis_matrix(4) is not computational2pauli_basis_matrix(4)
+    np.testing.assert_allclose(computational2pauli_basis_matrix(4),
+                               pauli2computational_basis_matrix(4).conj().T / 4)
+
+
+def test_structured_pauli_liouville_conversions():
+    rs = np.random.RandomState(52)
+    for dim in [2, 4, 8]:
+        superop = rs.randn(dim ** 2, dim ** 2) + 1j * rs.randn(dim ** 2, dim ** 2)
+        c2p = computational2pauli_basis_matrix(dim)
+        p2c = pauli2computational_basis_matrix(dim)
+        np.testing.assert_allclose(superop2pauli_liouville(superop),
+                                   c2p @ superop @ c2p.conj().T * dim, atol=1e-12)
+        np.testing.assert_allclose(pauli_liouville2superop(superop),
+                                   p2c @ superop @ p2c.conj().T / dim, atol=1e-12)
+
+
 def test_pl_to_choi():
     for i, pauli in enumerate(n_qubit_pauli_basis(2)):
         pl = kraus2pauli_liouville(pauli[1])
@@ -123,3 +152,27 @@ def test_choi_pl_bijectivity():
     h_superop = kraus2superop(HADAMARD)
     assert np.allclose(choi2superop(choi2superop(h_choi)), h_choi)
     assert np.allclose(superop2choi(superop2choi(h_superop)), h_superop)
+
+
+def test_batched_conversions():
+    kraus_batch = np.array([AdKrausOps, (np.sqrt(.9) * np.eye(2), np.sqrt(.1) * sigma_z),
+                            (HADAMARD, np.zeros((2, 2)))])
+    superops = kraus2superop(kraus_batch)
+    chois = kraus2choi(kraus_batch)
+    pls = kraus2pauli_liouville(kraus_batch)
+    assert superops.shape == chois.shape == pls.shape == (3, 4, 4)
+    np.testing.assert_allclose(superop2choi(superops), chois)
+    np.testing.assert_allclose(choi2superop(chois), superops)
+    np.testing.assert_allclose(superop2pauli_liouville(superops), pls)
+    np.testing.assert_allclose(pauli_liouville2choi(pls), chois, atol=1e-12)
+    np.testing.assert_allclose(choi2pauli_liouville(chois), pls, atol=1e-12)
+
+    kraus_stack = choi2kraus(chois)
+    assert kraus_stack.shape == (3, 4, 2, 2)
+    for kraus_ops, superop, choi, pl, stacked_kraus in zip(kraus_batch, superops, chois, pls,
+                                                           kraus_stack):
+        np.testing.assert_allclose(superop, kraus2superop(list(kraus_ops)))
+        np.testing.assert_allclose(choi, kraus2choi(list(kraus_ops)))
+        np.testing.assert_allclose(pl, kraus2pauli_liouville(list(kraus_ops)))
+        np.testing.assert_allclose(kraus2choi(stacked_kraus), choi, atol=1e-12)
+
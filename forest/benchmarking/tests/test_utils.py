@@ -1,3 +1,4 @@
+import pytest
 from pyquil.paulis import PauliTerm
 
 from forest.benchmarking.utils import *
@@ -56,3 +57,66 @@ def test_partial_trace():
     rho = np.kron(I, I) / 4
     np.testing.assert_array_equal(I / 2, partial_trace(rho, [1], [2, 2]))
     np.testing.assert_array_equal(I / 2, partial_trace(rho, [0], [2, 2]))
+
+
+def test_n_qubit_pauli_basis():
+    for n_qubits in [1, 2, 3]:
+        product = PAULI_BASIS ** n_qubits
+        basis = n_qubit_pauli_basis(n_qubits)
+        lazy = n_qubit_pauli_basis(n_qubits, lazy=True)
+        assert n_qubit_pauli_basis(n_qubits) is basis
+        assert basis.ops.shape == (4 ** n_qubits, 2 ** n_qubits, 2 ** n_qubits)
+        assert list(basis.labels) == list(lazy.labels) == product.labels
+        assert isinstance(basis.labels, tuple)
+        for idx, (label, op) in enumerate(product):
+            np.testing.assert_allclose(basis.ops[idx], op)
+            np.testing.assert_allclose(lazy.ops[idx], op)
+            np.testing.assert_allclose(basis.operator(label), op)
+            assert basis.index(label) == lazy.index(label) == idx
+    assert not basis.ops.flags.writeable
+    assert len(lazy.ops) == 64 and lazy.labels[-1] == 'ZZZ'
+    with pytest.raises(IndexError):
+        lazy.ops[64]
+    with pytest.raises(ValueError):
+        basis.index('XX')
+    with pytest.raises(ValueError):
+        n_qubit_pauli_basis(0)
+
+
+def test_large_dense_pauli_basis_is_not_cached(monkeypatch):
+    import forest.benchmarking.utils as utils
+    monkeypatch.setattr(utils, '_MAX_CACHED_DENSE_QUBITS', 1)
+    assert n_qubit_pauli_basis(1) is n_qubit_pauli_basis(1)
+    assert n_qubit_pauli_basis(2) is not n_qubit_pauli_basis(2)
+    assert n_qubit_pauli_basis(2, lazy=True) is n_qubit_pauli_basis(2, lazy=True)
+    np.testing.assert_allclose(n_qubit_pauli_basis(2).ops, (PAULI_BASIS ** 2).ops)
+
+
+def test_pauli_basis_traces_and_sum():
+    n_qubits = 2
+    rs = np.random.RandomState(52)
+    matrices = rs.randn(3, 4, 4) + 1j * rs.randn(3, 4, 4)
+    basis = n_qubit_pauli_basis(n_qubits)
+    traces = pauli_basis_traces(matrices)
+    expected = [[np.trace(op @ matrix) for op in basis.ops] for matrix in matrices]
+    np.testing.assert_allclose(traces, expected, atol=1e-12)
+    # the Pauli operators are orthogonal with norm 2^n
+    np.testing.assert_allclose(pauli_basis_sum(traces) / 4, matrices, atol=1e-12)
+    np.testing.assert_allclose(pauli_basis_sum(np.eye(16)[5]), basis.ops[5])
+
+
+def test_parametric_prod_state_prep():
+    from pyquil.operator_estimation import _OneQState, TensorProductState
+    from pyquil.unitary_tools import program_unitary, lifted_state_operator
+
+    qubits = [0, 1]
+    zero = np.zeros((4, 1))
+    zero[0] = 1
+    for labels in itertools.product(LOCAL_STATE_BLOCH_ANGLES.keys(), repeat=2):
+        ops = ['{}_{}'.format(label, qubit) for label, qubit in zip(labels, qubits)]
+        angles = local_state_prep_angles(ops, qubits)
+        psi = program_unitary(prepare_parametric_prod_state(qubits, angles), n_qubits=2) @ zero
+        state = TensorProductState([_OneQState(label[:-1], int(label[-1]), qubit)
+                                    for label, qubit in zip(labels, qubits)])
+        np.testing.assert_allclose(psi @ psi.conj().T,
+                                   lifted_state_operator(state, qubits=qubits), atol=1e-12)
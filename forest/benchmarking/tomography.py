@@ -1,27 +1,33 @@
 import functools
 import itertools
-from dataclasses import dataclass
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
 from operator import mul
 from typing import Callable, Tuple, List, Optional, Union, Sequence
 
 import matplotlib.pyplot as plt
 import numpy as np
 from matplotlib.colors import LinearSegmentedColormap
-from scipy.linalg import logm, pinv, eigh
+from scipy.linalg import pinv
+from scipy.optimize import minimize
+from scipy.sparse.linalg import LinearOperator, aslinearoperator
 
 import forest.benchmarking.distance_measures as dm
 import forest.benchmarking.operator_estimation as est
 from forest.benchmarking.superoperator_conversion import vec, unvec
-from forest.benchmarking.utils import prepare_prod_sic_state, n_qubit_pauli_basis, partial_trace
+from forest.benchmarking.utils import n_qubit_pauli_basis, partial_trace, \
+    pauli_basis_traces, pauli_basis_sum, prepare_parametric_prod_state, local_state_prep_angles
 from pyquil import Program
 from pyquil.api import QuantumComputer
 from pyquil.operator_estimation import ExperimentSetting, \
     TomographyExperiment as PyQuilTomographyExperiment, ExperimentResult, SIC0, SIC1, SIC2, SIC3, \
     plusX, minusX, plusY, minusY, plusZ, minusZ, TensorProductState, zeros_state
-from pyquil.paulis import sI, sX, sY, sZ, PauliSum, PauliTerm, is_identity
-from pyquil.unitary_tools import lifted_pauli, lifted_state_operator
+from pyquil.paulis import sI, sX, sY, sZ, PauliTerm, is_identity
+from pyquil.unitary_tools import lifted_state_operator
 
 MAXITER = "maxiter"
+MAXTIME = "maxtime"
 OPTIMAL = "optimal"
 FRO = 'fro'
 
@@ -77,6 +83,43 @@ def generate_state_tomography_experiment(program: Program, qubits: List[int]):
                                       program=program, qubits=qubits)
 
 
+def generate_random_state_tomography_experiment(program: Program, qubits: List[int],
+                                                n_settings: int, rs=None):
+    """Generate a (pyQuil) TomographyExperiment measuring `n_settings` distinct non-identity
+    Pauli operators on `qubits`, chosen uniformly at random.
+
+    For nearly pure states, a number of settings that grows like d log(d)^2 rather than d^2 is
+    enough for :py:func:`low_rank_state_estimate`, see [CS].
+
+    [CS] Quantum state tomography via compressed sensing
+         Gross et al.,
+         PRL 105, 150401 (2010)
+         https://doi.org/10.1103/PhysRevLett.105.150401
+         https://arxiv.org/abs/0909.3304
+
+    :param program: The program to prepare a state to tomographize
+    :param qubits: The qubits to tomographize
+    :param n_settings: The number of Pauli operators to measure, at most 4^len(qubits) - 1.
+    :param rs: Optional random state.
+    """
+    if rs is None:
+        rs = np.random
+    if not 0 < n_settings < 4 ** len(qubits):
+        raise ValueError("There are only {} non-identity Paulis on {} qubits."
+                         .format(4 ** len(qubits) - 1, len(qubits)))
+    labels = set()
+    settings = []
+    while len(settings) < n_settings:
+        label = tuple(rs.randint(4, size=len(qubits)))
+        if label in labels or not any(label):
+            continue
+        labels.add(label)
+        o_op = functools.reduce(mul, ([sI, sX, sY, sZ][op](q) for op, q in zip(label, qubits)),
+                                sI())
+        settings.append(ExperimentSetting(in_state=zeros_state(qubits), out_operator=o_op))
+    return PyQuilTomographyExperiment(settings=settings, program=program, qubits=qubits)
+
+
 def _sic_process_tomo_settings(qubits: Sequence[int]):
     """Yield settings over SIC basis cross I,X,Y,Z operators
 
@@ -176,7 +219,69 @@ class TomographyData:
     """number of shots used to calculate the `expectation`"""
 
 
+@dataclass
+class ExperimentResultArrays:
+    """
+    The results of a tomography experiment stored as arrays indexed by setting, rather than as a
+    list of ExperimentResult objects.
+
+    This behaves as a read-only sequence of ExperimentResult, so it may be passed to anything
+    expecting a list of results, but estimators in this module use the arrays directly. The
+    expectations may also be a stack of datasets over the same settings, e.g. bootstrap
+    resamples, which :py:func:`linear_inv_state_estimate` estimates all at once.
+    """
+
+    settings: List[ExperimentSetting]
+    """The measured settings; entry i of each of the arrays below refers to settings[i]"""
+
+    expectations: np.ndarray
+    """(n_settings,) expectation values, or (n_datasets, n_settings) for a stack of datasets"""
+
+    stddevs: np.ndarray
+    """(n_settings,) standard deviations associated with the expectations"""
+
+    counts: np.ndarray
+    """(n_settings,) number of shots used to calculate each expectation"""
+
+    @classmethod
+    def from_results(cls, results: Sequence[ExperimentResult]) -> 'ExperimentResultArrays':
+        if isinstance(results, cls):
+            return results
+        return cls(settings=[result.setting for result in results],
+                   expectations=np.array([result.expectation for result in results]),
+                   stddevs=np.array([result.stddev for result in results]),
+                   counts=np.array([result.total_counts for result in results]))
+
+    def __len__(self):
+        return len(self.settings)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(len(self))[index]]
+        if self.expectations.ndim != 1:
+            raise ValueError("Can't construct an ExperimentResult from a stack of datasets.")
+        return ExperimentResult(setting=self.settings[index],
+                                expectation=self.expectations[index],
+                                stddev=self.stddevs[index],
+                                total_counts=self.counts[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
 def shim_pyquil_results_to_TomographyData(program, qubits, results: List[ExperimentResult]):
+    if isinstance(results, ExperimentResultArrays):
+        return TomographyData(
+            in_ops=[setting.in_operator for setting in results.settings[1:]],
+            out_ops=[setting.out_operator for setting in results.settings[1:]],
+            expectations=results.expectations[1:].tolist(),
+            variances=(results.stddevs[1:] ** 2).tolist(),
+            program=program,
+            number_qubits=len(qubits),
+            dimension=2 ** len(qubits),
+            counts=results.counts[1:].tolist(),
+        )
     return TomographyData(
         in_ops=[r.setting.in_operator for r in results[1:]],
         out_ops=[r.setting.out_operator for r in results[1:]],
@@ -206,31 +311,30 @@ def acquire_tomography_data(experiment: TomographyExperiment, qc: QuantumCompute
     n_qubits = len(qubits)
     dimension = 2 ** len(qubits)
 
-    expectations = []
-    variances = []
-    counts = []
+    # out_ops sharing a local diagonalizing basis are estimated from the same bitstrings
+    pauli_sets = _group_out_ops(experiment.out_ops)
 
     if experiment.in_ops is None:
         # state tomography
-        for op in experiment.out_ops:
-            # data aqcuisition
-            expectation, variance, count = est.estimate_locally_commuting_operator(experiment.program, PauliSum([op]),
-                                                                                   var, qc, symmetrize=symmetrize)
-            expectations.append(np.real(expectation[0]))
-            variances.append(variance[0, 0].real)
-            counts.append(count)
+        program = experiment.program
+        memory_maps = [None]
     else:
-        # process tomography
-        for in_op in experiment.in_ops:
-            for op in experiment.out_ops:
-                # data aqcuisition
-                tot_prog = prepare_prod_sic_state(in_op) + experiment.program
-                expectation, variance, count = est.estimate_locally_commuting_operator(tot_prog, PauliSum([op]), var,
-                                                                                       qc, symmetrize=symmetrize)
-
-                expectations.append(np.real(expectation[0]))
-                variances.append(variance[0, 0].real)
-                counts.append(count)
+        # process tomography; all input states share one parametric preparation program, so
+        # that each measurement basis compiles once and the states are swept at run time
+        prep_qubits = sorted({int(op.split('_')[1]) for in_op in experiment.in_ops for op in in_op})
+        program = Program()
+        angles = program.declare('prep_angles', 'REAL', 2 * len(prep_qubits))
+        program += prepare_parametric_prod_state(prep_qubits, angles)
+        program += experiment.program
+        memory_maps = [{'prep_angles': local_state_prep_angles(in_op, prep_qubits)}
+                       for in_op in experiment.in_ops]
+
+    # data aqcuisition
+    expectations, variances, counts = _estimate_out_ops(program, experiment.out_ops, pauli_sets,
+                                                        var, qc, symmetrize, memory_maps)
+    expectations = expectations.flatten().tolist()
+    variances = variances.flatten().tolist()
+    counts = counts.flatten().tolist()
 
     exp_data = TomographyData(
         in_ops=experiment.in_ops,
@@ -245,6 +349,156 @@ def acquire_tomography_data(experiment: TomographyExperiment, qc: QuantumCompute
     return exp_data
 
 
+def _group_out_ops(out_ops: List[PauliTerm]):
+    """
+    Group the non-identity out_ops into sets diagonal in a common local basis.
+
+    The full Pauli basis on n qubits falls into 3^n such sets rather than 4^n - 1 separate
+    measurements.
+
+    :param out_ops: The Pauli operators to be measured.
+    :return: A dictionary from (qubit, Pauli) tuples describing each basis to the indices into
+        `out_ops` of the operators measured in it.
+    """
+    non_identity = [idx for idx, op in enumerate(out_ops) if not is_identity(op)]
+    # copies make each term identifiable through the grouping, even if out_ops repeats a term
+    terms = [out_ops[idx].copy() for idx in non_identity]
+    indices = {id(term): idx for term, idx in zip(terms, non_identity)}
+    return {key: [indices[id(term)] for term in pset]
+            for key, pset in est.commuting_sets_by_zbasis(terms).items()}
+
+
+def _estimate_out_ops(program: Program, out_ops: List[PauliTerm], pauli_sets, var: float,
+                      qc: QuantumComputer, symmetrize: bool, memory_maps: Sequence[Optional[dict]]):
+    """
+    Estimate the expectation of each of `out_ops` after `program`, with one round of sampling per
+    set of `pauli_sets` (see :py:func:`_group_out_ops`) and memory map.
+
+    Each set is compiled once with :py:func:`compile_pauli_sum_estimation` and then sampled for
+    every memory map, which parametrizes `program` (e.g. its state preparation). Each set is
+    sampled until the variance of the estimate of every one of its terms is within `var`, and
+    these variances are read off the diagonal of the sample covariance. Identity operators are
+    not measured.
+
+    :return: The expectations, estimator variances and numbers of shots, as arrays of shape
+        (len(memory_maps), len(out_ops)).
+    """
+    shape = (len(memory_maps), len(out_ops))
+    expectations = np.zeros(shape)
+    variances = np.zeros(shape)
+    counts = np.zeros(shape, dtype=int)
+
+    for idx, op in enumerate(out_ops):
+        if is_identity(op):
+            expectations[:, idx] = np.real(op.coefficient)
+
+    for basis, indices in pauli_sets.items():
+        terms = [out_ops[idx] for idx in indices]
+        executable = est.compile_pauli_sum_estimation(terms, dict(basis), program, var, qc,
+                                                      commutation_check=False,
+                                                      symmetrize=symmetrize, per_term=True)
+        for map_idx, memory_map in enumerate(memory_maps):
+            results = est.sample_pauli_sum(executable, qc, memory_map=memory_map)
+            covariance = np.atleast_2d(results.covariance)
+            for row, idx in enumerate(indices):
+                expectations[map_idx, idx] = np.real(results.pauli_expectations[row])
+                variances[map_idx, idx] = np.real(abs(terms[row].coefficient) ** 2
+                                                  * covariance[row, row] / (results.n_shots - 1))
+                counts[map_idx, idx] = results.n_shots
+
+    return expectations, variances, counts
+
+
+@dataclass
+class IterationInfo:
+    """Progress of an iterative estimator, passed to its callback after every iteration"""
+
+    iteration: int
+    """The number of iterations completed"""
+
+    cost: float
+    """The quantity being minimized, e.g. the negative log likelihood, at the current estimate"""
+
+    step_size: float
+    """The Frobenius norm of the change in the estimate made by this iteration"""
+
+    elapsed: float
+    """Wall-clock time in seconds since the estimator started"""
+
+    estimate: np.ndarray
+    """The current estimate"""
+
+
+class ConvergenceTrace:
+    """
+    A callback for the iterative estimators in this module that records their convergence
+    history, e.g. to tune tolerances or to detect stalled estimates in a batch of runs::
+
+        trace = ConvergenceTrace()
+        estimate = pgdb_process_estimate(results, qubits, callback=trace)
+        plt.semilogy(trace.elapsed, trace.costs - trace.costs[-1])
+    """
+
+    def __init__(self, keep_estimates: bool = False):
+        """
+        :param keep_estimates: Also record the estimate of every iteration.
+        """
+        self.keep_estimates = keep_estimates
+        self.history = []
+        self.estimates = []
+
+    def __call__(self, info: IterationInfo):
+        self.history.append((info.iteration, info.cost, info.step_size, info.elapsed))
+        if self.keep_estimates:
+            self.estimates.append(info.estimate)
+
+    def __len__(self):
+        return len(self.history)
+
+    @property
+    def iterations(self) -> np.ndarray:
+        return np.array([entry[0] for entry in self.history], dtype=int)
+
+    @property
+    def costs(self) -> np.ndarray:
+        return np.array([entry[1] for entry in self.history])
+
+    @property
+    def step_sizes(self) -> np.ndarray:
+        return np.array([entry[2] for entry in self.history])
+
+    @property
+    def elapsed(self) -> np.ndarray:
+        return np.array([entry[3] for entry in self.history])
+
+    def stalled(self, window: int = 10, rtol: float = 1e-6) -> bool:
+        """
+        Whether the cost improved by less than a fraction `rtol` of its magnitude over the last
+        `window` iterations.
+        """
+        if len(self) <= window:
+            return False
+        costs = self.costs
+        return costs[-window - 1] - costs[-1] <= rtol * abs(costs[-1])
+
+
+class _BudgetExhausted(Exception):
+    """Raised from a callback to stop an optimizer that has no time budget of its own"""
+
+
+def _budget_status(iteration: int, maxiter: Optional[int], start_time: float,
+                   max_time: Optional[float]) -> Optional[str]:
+    """
+    :return: MAXITER or MAXTIME if `iteration` iterations, started at `start_time`, exhaust the
+        corresponding budget, else None. A budget of None is unlimited.
+    """
+    if maxiter is not None and iteration >= maxiter:
+        return MAXITER
+    if max_time is not None and time.perf_counter() - start_time >= max_time:
+        return MAXTIME
+    return None
+
+
 @dataclass
 class StateTomographyEstimate:
     """State estimate from tomography experiment"""
@@ -308,7 +562,7 @@ class TomographyEstimate:
     """State or process estimate from tomography experiment"""
 
 
-def linear_inv_state_estimate(results: List[ExperimentResult],
+def linear_inv_state_estimate(results: Union[List[ExperimentResult], ExperimentResultArrays],
                               qubits: List[int]) -> np.ndarray:
     """
     Estimate a quantum state using linear inversion.
@@ -326,37 +580,166 @@ def linear_inv_state_estimate(results: List[ExperimentResult],
            PhD thesis from University of Waterloo, (2015).
            http://hdl.handle.net/10012/9557
 
-    :param results: A tomographically complete list of results.
+    :param results: A tomographically complete list of results, or the equivalent
+        :py:class:`ExperimentResultArrays`. If the arrays hold a (n_datasets, n_settings) stack
+        of expectations then every dataset is estimated at once.
     :param qubits: All qubits that were tomographized. This specifies the order in
         which qubits will be kron'ed together.
-    :return: A point estimate of the quantum state rho.
+    :return: A point estimate of the quantum state rho, or a (n_datasets, d, d) stack of
+        estimates.
+    """
+    results = ExperimentResultArrays.from_results(results)
+    dim = 2 ** len(qubits)
+    indices, coefficients = _pauli_basis_indices([setting.out_operator
+                                                  for setting in results.settings], qubits)
+
+    if len(set(indices)) == len(indices):
+        # The measured Paulis are orthogonal, so the least squares solution is simply
+        # rho = (1 / d) sum_P <P> P, with each coefficient of P divided out.
+        pauli_coefficients = np.zeros(results.expectations.shape[:-1] + (dim ** 2,), dtype=complex)
+        pauli_coefficients[..., indices] = results.expectations / np.conj(coefficients)
+        return pauli_basis_sum(pauli_coefficients) / dim
+
+    rho = _measurement_matrix_pinv(len(qubits), indices, coefficients) @ results.expectations.T
+    if rho.ndim == 1:
+        return unvec(rho)
+    # unvec each column
+    return rho.T.reshape(-1, dim, dim).swapaxes(-1, -2)
+
+
+def _pauli_basis_indices(pauli_terms: Sequence[PauliTerm], qubits: List[int]) \
+        -> Tuple[Tuple[int, ...], Tuple[complex, ...]]:
     """
-    measurement_matrix = np.vstack([
-        vec(lifted_pauli(result.setting.out_operator, qubits=qubits)).T.conj()
-        for result in results
-    ])
-    expectations = np.array([result.expectation for result in results])
-    rho = pinv(measurement_matrix) @ expectations
-    return unvec(rho)
+    Find the index in ``n_qubit_pauli_basis(len(qubits))`` and the coefficient of each term, where
+    qubits are kron'ed together as in :py:func:`~pyquil.unitary_tools.lifted_pauli`, i.e.
+    ``qubits[0]`` is the right-most tensor factor.
 
+    :param pauli_terms: The Pauli terms to locate.
+    :param qubits: The qubits that the terms act on.
+    :return: A tuple of indices and a tuple of coefficients, one for each term.
+    """
+    indices = []
+    for term in pauli_terms:
+        if not set(term.get_qubits()) <= set(qubits):
+            raise ValueError("{} acts on qubits outside of {}".format(term, qubits))
+        index = 0
+        for qubit in reversed(qubits):
+            index = 4 * index + 'IXYZ'.index(term[qubit])
+        indices.append(index)
+    return tuple(indices), tuple(complex(term.coefficient) for term in pauli_terms)
+
+
+@functools.lru_cache(maxsize=32)
+def _measurement_matrix_pinv(n_qubits: int, indices: Tuple[int, ...],
+                             coefficients: Tuple[complex, ...]) -> np.ndarray:
+    """
+    The pseudo-inverse of the linear inversion measurement matrix, whose rows are
+    vec(c_k P_k)^dagger for the Pauli operators P_k = ``n_qubit_pauli_basis(n_qubits).ops[index]``.
 
-def construct_projection_operators_on_n_qubits(num_qubits) -> List[np.ndarray]:
+    This is cached, keyed on the measured operators, so repeated estimates from the same
+    settings (e.g. in :py:func:`estimate_variance`) only pay for the SVD once.
     """
+    dim = 2 ** n_qubits
+    one_hot = np.zeros((len(indices), dim ** 2), dtype=complex)
+    one_hot[np.arange(len(indices)), indices] = coefficients
+    operators = pauli_basis_sum(one_hot)
+    # the rows are vec(op)^dagger, where vec stacks columns
+    measurement_matrix = operators.swapaxes(-1, -2).reshape(len(indices), -1).conj()
+    return pinv(measurement_matrix)
+
+
+def construct_projection_operators_on_n_qubits(num_qubits) -> np.ndarray:
+    """
+    Construct the projectors onto the +1 and -1 eigenspaces of every non-identity Pauli operator
+    on `num_qubits` qubits.
+
+    The effects are stacked into a single array so that the probabilities of all outcomes, and
+    weighted sums of the effects, can each be computed in one contraction. See :py:func:`_R`.
+
+    :param num_qubits: The number of qubits.
+    :return: A (2 * (4^n - 1), 2^n, 2^n) array whose entries alternate between (I + P) / 2 and
+        (I - P) / 2 for each non-identity P in the order of :py:func:`n_qubit_pauli_basis`.
     """
     # Identity prop to the size of Hilbert space
     IdH = np.eye(2 ** num_qubits, 2 ** num_qubits)
-    effects = []
-    for i, operator in enumerate(n_qubit_pauli_basis(num_qubits).ops):
-        if i == 0:
-            continue
-            # Might need to change for >1Q.
-        effects.append((IdH + operator) / 2)
-        effects.append((IdH - operator) / 2)
+    paulis = np.asarray(n_qubit_pauli_basis(num_qubits).ops[1:], dtype=complex)
+    effects = np.empty((2 * len(paulis),) + IdH.shape, dtype=complex)
+    effects[0::2] = (IdH + paulis) / 2
+    effects[1::2] = (IdH - paulis) / 2
     return effects
 
 
+class PauliProjectionOperators:
+    """
+    A matrix-free version of the effects returned by
+    :py:func:`construct_projection_operators_on_n_qubits`.
+
+    Since every effect is of the form Pi_(P, +-) = (I +- P) / 2, the probabilities Tr[rho Pi_j]
+    only require the Pauli expectations of rho, and the weighted sum sum_j w_j Pi_j is a single
+    linear combination of Pauli operators. Both are computed by acting on one tensor factor at a
+    time (see :py:func:`pauli_basis_traces`), so the 2 * (4^n - 1) dense effects are never stored.
+    """
+
+    def __init__(self, num_qubits: int):
+        """
+        :param num_qubits: The number of qubits.
+        """
+        self.num_qubits = num_qubits
+        self.dim = 2 ** num_qubits
+
+    def __len__(self):
+        return 2 * (4 ** self.num_qubits - 1)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """
+        Construct a single dense effect, in the same order as
+        :py:func:`construct_projection_operators_on_n_qubits`.
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError("effect index out of range")
+        index %= len(self)
+        coefficients = np.zeros(4 ** self.num_qubits)
+        coefficients[0] = 1 / 2
+        coefficients[index // 2 + 1] = 1 / 2 if index % 2 == 0 else -1 / 2
+        return pauli_basis_sum(coefficients)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def probabilities(self, state: np.ndarray) -> np.ndarray:
+        """
+        Compute Tr[rho Pi_j] for every effect.
+
+        :param state: A (..., d, d) density matrix or stack of density matrices.
+        :return: A (..., 2 * (4^n - 1)) array of probabilities.
+        """
+        traces = np.real(pauli_basis_traces(state))
+        probs = np.empty(traces.shape[:-1] + (len(self),))
+        probs[..., 0::2] = (traces[..., :1] + traces[..., 1:]) / 2
+        probs[..., 1::2] = (traces[..., :1] - traces[..., 1:]) / 2
+        return probs
+
+    def weighted_sum(self, weights: np.ndarray) -> np.ndarray:
+        """
+        Compute sum_j w_j Pi_j.
+
+        :param weights: A (..., 2 * (4^n - 1)) array of weights, one for each effect.
+        :return: A (..., d, d) array.
+        """
+        weights = np.asarray(weights)
+        plus, minus = weights[..., 0::2], weights[..., 1::2]
+        coefficients = np.empty(weights.shape[:-1] + (4 ** self.num_qubits,), dtype=weights.dtype)
+        coefficients[..., 0] = np.sum(plus + minus, axis=-1) / 2
+        coefficients[..., 1:] = (plus - minus) / 2
+        return pauli_basis_sum(coefficients)
+
+
 def iterative_mle_state_estimate(results: List[ExperimentResult], qubits: List[int], dilution=.005,
-                                 entropy_penalty=0.0, beta=0.0, tol=1e-9, maxiter=100_000) \
+                                 entropy_penalty=0.0, beta=0.0, tol=1e-9, maxiter=100_000,
+                                 initial_state: Optional[np.ndarray] = None,
+                                 max_time: Optional[float] = None,
+                                 callback: Optional[Callable[[IterationInfo], None]] = None) \
         -> TomographyEstimate:
     """
     Given tomography data, use one of three iterative algorithms to return an estimate of the
@@ -406,7 +789,15 @@ def iterative_mle_state_estimate(results: List[ExperimentResult], qubits: List[i
     :param tol: The largest difference in the frobenious norm between update steps that will cause
          the algorithm to conclude that it has converged.
     :param maxiter: The maximum number of iterations to perform before aborting the procedure.
-    :return: A TomographyEstimate whose estimate is a StateTomographyEstimate
+    :param initial_state: The density matrix to start the iteration from, e.g. an estimate from
+        similar data; defaults to the maximally mixed state. The iteration never leaves the
+        support of the initial state, so this should be full rank.
+    :param max_time: The maximum wall-clock time in seconds, after which the procedure is
+        aborted with status MAXTIME.
+    :param callback: An optional function called after every iteration with an
+        :py:class:`IterationInfo`, whose cost is the negative log likelihood, e.g. a
+        :py:class:`ConvergenceTrace`.
+    :return: A TomographyEstimate whose estimate is a StateTomographyEstimate, and the status
     """
     data = shim_pyquil_results_to_TomographyData(
         program=None,
@@ -432,38 +823,32 @@ def iterative_mle_state_estimate(results: List[ExperimentResult], qubits: List[i
         num_plus_one = int((expectation + 1) / 2 * count)
         freq.append(num_plus_one)
         freq.append(count - num_plus_one)
+    freq = np.asarray(freq)
 
-    effects = construct_projection_operators_on_n_qubits(data.number_qubits)
+    effects = PauliProjectionOperators(data.number_qubits)
 
-    rho = IdH / data.dimension
-    epsilon = 1 / dilution  # Dilution parameter used in [DIMLE1].
+    num_meas = np.array([data.counts[0] * len(data.out_ops)])
+
+    rho = IdH / data.dimension if initial_state is None else np.asarray(initial_state)
+    start_time = time.perf_counter()
     iteration = 1
     status = OPTIMAL
     while True:
         rho_temp = rho
-        if iteration >= maxiter:
-            status = MAXITER
+        budget_status = _budget_status(iteration, maxiter, start_time, max_time)
+        if budget_status is not None:
+            status = budget_status
             break
-        # Vanilla Iterative MLE
-        Tk = _R(rho, effects, freq) - IdH  # Eq 6 of [DIMLE2] with \lambda = 0.
-
-        # MaxENT Iterative MLE
-        if entropy_penalty > 0.0:
-            constraint = (logm(rho) - IdH * np.trace(rho.dot(logm(rho))))
-            Tk -= (entropy_penalty * constraint)  # Eq 6 of [DIMLE2] with \lambda \neq 0.
-
-        # Hedged Iterative MLE
-        if beta > 0.0:
-            num_meas = data.counts[0] * len(data.out_ops)
-            # TODO: decide if can use pinv consistently from one of np or scipy
-            Tk = (beta * (np.linalg.pinv(rho) - data.dimension * IdH)
-                  + num_meas * (_R(rho, effects, freq) - IdH))
-
-        # compute iterative estimate of rho     
-        update_map = (IdH + epsilon * Tk)
-        rho = update_map.dot(rho).dot(update_map)
-        rho /= np.trace(rho)  # Eq 5 of [DIMLE2].
-        if np.linalg.norm(rho - rho_temp, FRO) < tol:
+        # a batch of one, so that the max-entropy and hedged updates share a single Hermitian
+        # eigendecomposition per iteration
+        rho = _batched_mle_update(rho[np.newaxis], effects, freq[np.newaxis], num_meas,
+                                  dilution, entropy_penalty, beta)[0]
+        step_size = np.linalg.norm(rho - rho_temp, FRO)
+        if callback is not None:
+            callback(IterationInfo(iteration=iteration, cost=-float(_LL(rho, effects, freq)),
+                                   step_size=step_size,
+                                   elapsed=time.perf_counter() - start_time, estimate=rho))
+        if step_size < tol:
             break
         iteration += 1
 
@@ -490,6 +875,180 @@ def iterative_mle_state_estimate(results: List[ExperimentResult], qubits: List[i
     return est_data, status
 
 
+def batch_iterative_mle_state_estimate(results_batch: Sequence[List[ExperimentResult]],
+                                       qubits: List[int], dilution=.005, entropy_penalty=0.0,
+                                       beta=0.0, tol=1e-9, maxiter=100_000,
+                                       max_time: Optional[float] = None,
+                                       callback: Optional[Callable[[IterationInfo], None]] = None) \
+        -> List[Tuple[TomographyEstimate, str]]:
+    """
+    Run :py:func:`iterative_mle_state_estimate` on many datasets at once.
+
+    Every dataset must come from the same state tomography settings, e.g. the same
+    experiment run on different groups of qubits. The updates are applied to a
+    (batch, d, d) stack of estimates and each estimate is frozen as soon as it converges, so
+    many small tomography problems are solved in a single vectorized loop.
+
+    :param results_batch: A sequence of tomographically complete lists of results, one per
+        dataset, each with the same settings in the same order.
+    :param qubits: The qubits that were tomographized. This specifies the order in which qubits
+        will be kron'ed together; the labels need not match those of each dataset.
+    :param dilution: See :py:func:`iterative_mle_state_estimate`.
+    :param entropy_penalty: See :py:func:`iterative_mle_state_estimate`.
+    :param beta: See :py:func:`iterative_mle_state_estimate`.
+    :param tol: See :py:func:`iterative_mle_state_estimate`.
+    :param maxiter: See :py:func:`iterative_mle_state_estimate`.
+    :param max_time: The maximum wall-clock time in seconds, after which the datasets that have
+        not converged are given status MAXTIME.
+    :param callback: An optional function called after every iteration with an
+        :py:class:`IterationInfo` for the whole batch: its cost is the total negative log
+        likelihood, its step size the largest of those of the unconverged datasets, and its
+        estimate the (batch, d, d) stack of estimates.
+    :return: A list with a (TomographyEstimate, status) tuple for each dataset.
+    """
+    if (entropy_penalty != 0.0) and (beta != 0.0):
+        raise ValueError("One can't sensibly do entropy penalty and hedging. Do one or the other"
+                         " but not both.")
+    exp_type = 'iterative_MLE'
+    if entropy_penalty != 0.0:
+        exp_type = 'max_entropy_MLE'
+    if beta != 0.0:
+        exp_type = 'heged_MLE'
+
+    datas = [shim_pyquil_results_to_TomographyData(program=None, qubits=qubits, results=results)
+             for results in results_batch]
+    for data in datas[1:]:
+        if len(data.out_ops) != len(datas[0].out_ops) or \
+                any(op.operations_as_set() != op0.operations_as_set()
+                    or op.coefficient != op0.coefficient
+                    for op, op0 in zip(data.out_ops, datas[0].out_ops)):
+            raise ValueError("Every dataset in the batch must have the same settings.")
+
+    dim = 2 ** len(qubits)
+    IdH = np.eye(dim, dim)
+    effects = PauliProjectionOperators(len(qubits))
+
+    expectations = np.array([data.expectations for data in datas])
+    counts = np.array([data.counts for data in datas])
+    num_plus_one = ((expectations + 1) / 2 * counts).astype(int)
+    freq = np.empty((len(datas), len(effects)))
+    freq[:, 0::2] = num_plus_one
+    freq[:, 1::2] = counts - num_plus_one
+    num_meas = counts[:, 0] * counts.shape[1]
+
+    rho = np.broadcast_to(IdH / dim, (len(datas), dim, dim)).astype(complex)
+    statuses = np.full(len(datas), OPTIMAL, dtype=object)
+    active = np.arange(len(datas))
+    start_time = time.perf_counter()
+    iteration = 1
+    while active.size > 0:
+        budget_status = _budget_status(iteration, maxiter, start_time, max_time)
+        if budget_status is not None:
+            statuses[active] = budget_status
+            break
+        rho_temp = rho[active]
+        rho_new = _batched_mle_update(rho_temp, effects, freq[active], num_meas[active],
+                                      dilution, entropy_penalty, beta)
+        rho[active] = rho_new
+        step_sizes = np.linalg.norm(rho_new - rho_temp, FRO, axis=(-2, -1))
+        if callback is not None:
+            loglike = np.sum(np.log10(effects.probabilities(rho)) * freq)
+            callback(IterationInfo(iteration=iteration, cost=-float(loglike),
+                                   step_size=float(np.max(step_sizes)),
+                                   elapsed=time.perf_counter() - start_time,
+                                   estimate=rho.copy()))
+        active = active[step_sizes >= tol]
+        iteration += 1
+
+    loglikes = np.sum(np.log10(effects.probabilities(rho)) * freq, axis=-1)
+
+    estimates = []
+    for data, rho_est, loglike, status in zip(datas, rho, loglikes, statuses):
+        estimate = StateTomographyEstimate(
+            state_point_est=rho_est,
+            type=exp_type,
+            beta=beta,
+            entropy=entropy_penalty,
+            dilution=dilution,
+            loglike=loglike
+        )
+        estimates.append((TomographyEstimate(
+            in_ops=data.in_ops,
+            program=data.program,
+            out_ops=data.out_ops,
+            dimension=data.dimension,
+            number_qubits=data.number_qubits,
+            expectations=data.expectations,
+            variances=data.variances,
+            estimate=estimate
+        ), status))
+    return estimates
+
+
+def _batched_mle_update(rho, effects, freq, num_meas, dilution, entropy_penalty, beta):
+    """
+    Apply one diluted MLE update, Eq 5 and 6 of [DIMLE2], to a (batch, d, d) stack of states.
+
+    The matrix logarithm and pseudo-inverse needed for the max-entropy and hedged variants are
+    computed from a batched Hermitian eigendecomposition.
+
+    :param rho: A (batch, d, d) stack of current estimates.
+    :param effects: The :py:class:`PauliProjectionOperators` that were measured.
+    :param freq: A (batch, n_effects) array of observed counts for each effect.
+    :param num_meas: A (batch,) array of the total number of measurements, used for hedging.
+    :return: The (batch, d, d) stack of updated estimates.
+    """
+    # this small number ~ 10^-304 is added so that we don't get divide by zero errors
+    machine_eps = np.finfo(float).tiny
+    dim = rho.shape[-1]
+    IdH = np.eye(dim, dim)
+    epsilon = 1 / dilution  # Dilution parameter used in [DIMLE1].
+
+    R = effects.weighted_sum(freq / (effects.probabilities(rho) + machine_eps))
+    Tk = R - IdH  # Eq 6 of [DIMLE2] with \lambda = 0.
+
+    if entropy_penalty > 0.0 or beta > 0.0:
+        eigvals, eigvecs = np.linalg.eigh(rho)
+
+    # MaxENT Iterative MLE
+    if entropy_penalty > 0.0:
+        log_eigvals = np.log(np.clip(eigvals, machine_eps, None))
+        log_rho = (eigvecs * log_eigvals[:, np.newaxis, :]) @ eigvecs.conj().swapaxes(-1, -2)
+        entropy = np.sum(eigvals * log_eigvals, axis=-1)
+        constraint = log_rho - IdH * entropy[:, np.newaxis, np.newaxis]
+        Tk -= (entropy_penalty * constraint)  # Eq 6 of [DIMLE2] with \lambda \neq 0.
+
+    # Hedged Iterative MLE
+    if beta > 0.0:
+        cutoff = 1e-15 * np.max(np.abs(eigvals), axis=-1, keepdims=True)
+        inv_eigvals = np.where(np.abs(eigvals) > cutoff, 1 / np.where(eigvals == 0, 1, eigvals), 0)
+        pinv_rho = (eigvecs * inv_eigvals[:, np.newaxis, :]) @ eigvecs.conj().swapaxes(-1, -2)
+        Tk = (beta * (pinv_rho - dim * IdH)
+              + num_meas[:, np.newaxis, np.newaxis] * (R - IdH))
+
+    # compute iterative estimate of rho
+    update_map = (IdH + epsilon * Tk)
+    rho = update_map @ rho @ update_map
+    return rho / np.trace(rho, axis1=-2, axis2=-1)[:, np.newaxis, np.newaxis]  # Eq 5 of [DIMLE2].
+
+
+def _effect_probabilities(state, effects) -> np.ndarray:
+    """
+    Compute the predicted probabilities Pr_j = Tr[Pi_j rho] of every effect in a single
+    matrix-vector product.
+
+    :param state: The state (given as a density matrix) that we think we have.
+    :param effects: A stack of effects, e.g. from :py:func:`construct_projection_operators_on_n_qubits`,
+        or a :py:class:`PauliProjectionOperators`.
+    :return: The real part of Tr[Pi_j rho] for each effect Pi_j.
+    """
+    if isinstance(effects, PauliProjectionOperators):
+        return effects.probabilities(state)
+    effects = np.asarray(effects)
+    # Tr[rho Pi] = sum_ij rho_ij Pi_ji, i.e. the inner product of Pi with rho^T
+    return np.real(effects.reshape(len(effects), -1) @ state.T.reshape(-1))
+
+
 def _R(state, effects, observed_frequencies):
     r"""
     This is Eqn 5 in [DIMLE1], i.e.
@@ -511,9 +1070,13 @@ def _R(state, effects, observed_frequencies):
     # this small number ~ 10^-304 is added so that we don't get divide by zero errors
     machine_eps = np.finfo(float).tiny
     # have a zero in the numerator, we can fix this is we look a little more carefully.
-    predicted_probs = np.array([np.real(np.trace(state.dot(effect))) for effect in effects])
-    update_operator = sum([effect * observed_frequencies[i] / (predicted_probs[i] + machine_eps)
-                           for i, effect in enumerate(effects)])
+    if not isinstance(effects, PauliProjectionOperators):
+        effects = np.asarray(effects)
+    predicted_probs = _effect_probabilities(state, effects)
+    weights = np.asarray(observed_frequencies) / (predicted_probs + machine_eps)
+    if isinstance(effects, PauliProjectionOperators):
+        return effects.weighted_sum(weights)
+    update_operator = np.tensordot(weights, effects, axes=1)
     return update_operator
 
 
@@ -527,9 +1090,249 @@ def _LL(state, effects, observed_frequencies) -> float:
      associated with effects.
     :return: The log likelihood that our state is the one we believe it is.
     """
-    observed_frequencies = np.array(observed_frequencies)
-    predicted_probs = np.array([np.real(np.trace(state.dot(effect))) for effect in effects])
-    return sum(np.log10(predicted_probs) * observed_frequencies)
+    observed_frequencies = np.asarray(observed_frequencies)
+    predicted_probs = _effect_probabilities(state, effects)
+    return np.sum(np.log10(predicted_probs) * observed_frequencies)
+
+
+class StreamingStateTomography:
+    """
+    Accumulates state tomography data as it arrives and provides an up-to-date estimate at any
+    time, for monitoring jobs where the data of :py:func:`generate_state_tomography_experiment`
+    is collected in many small batches.
+
+    Per setting only the number of +1 outcomes and the total number of outcomes are kept, so
+    ingesting data and forming the results passed to an estimator are O(settings). The MLE
+    estimate is warm started from the previous one, which is typically close to the new
+    optimum when little data was added in between.
+
+    Settings are identified by the Pauli operator measured; they are kept in the order of
+    :py:func:`generate_state_tomography_experiment`, which the estimators rely on.
+    """
+
+    def __init__(self, qubits: List[int]):
+        """
+        :param qubits: The qubits tomographized, in the order of the estimated density matrix.
+        """
+        self.qubits = list(qubits)
+        self.settings = [setting for settings in
+                         generate_state_tomography_experiment(Program(), self.qubits)
+                         for setting in settings]
+        self._setting_index = {self._label(setting.out_operator): idx
+                               for idx, setting in enumerate(self.settings)}
+        self.plus_counts = np.zeros(len(self.settings))
+        self.counts = np.zeros(len(self.settings), dtype=int)
+        self._mle_state = None
+
+    def _label(self, pauli_term: PauliTerm) -> str:
+        return ''.join(pauli_term[qubit] for qubit in self.qubits)
+
+    def _index(self, pauli_term: PauliTerm) -> int:
+        if not set(pauli_term.get_qubits()) <= set(self.qubits):
+            raise ValueError(f"{pauli_term} acts on qubits other than {self.qubits}")
+        return self._setting_index[self._label(pauli_term)]
+
+    def add_results(self, results: Sequence[ExperimentResult]):
+        """
+        Ingest results, e.g. from :py:func:`measure_observables`, for any of the settings.
+
+        :param results: ExperimentResults whose out_operator is a Pauli operator on the qubits.
+        """
+        for result in results:
+            out_op = result.setting.out_operator
+            expectation = np.real(result.expectation / out_op.coefficient)
+            idx = self._index(out_op)
+            self.plus_counts[idx] += result.total_counts * (1 + expectation) / 2
+            self.counts[idx] += result.total_counts
+
+    def add_bitstrings(self, out_operators: Sequence[PauliTerm], bitstrings: np.ndarray):
+        """
+        Ingest raw shots of a measurement in a local basis that diagonalizes each of
+        `out_operators`, e.g. those of one of the sets of :py:func:`commuting_sets_by_zbasis`.
+
+        :param out_operators: The Pauli operators to estimate from these shots.
+        :param bitstrings: (n_shots, n_qubits) array of outcomes (0 or 1) in the diagonalizing
+            basis, with columns in the order of `self.qubits`.
+        """
+        bitstrings = np.asarray(bitstrings)
+        for out_op in out_operators:
+            columns = [self.qubits.index(qubit) for qubit in out_op.get_qubits()]
+            parities = np.sum(bitstrings[:, columns], axis=1) % 2
+            idx = self._index(out_op)
+            self.plus_counts[idx] += np.count_nonzero(parities == 0)
+            self.counts[idx] += len(bitstrings)
+
+    def result_arrays(self) -> ExperimentResultArrays:
+        """
+        The data accumulated so far; settings without data have expectation 0.
+
+        :return: The results for all settings of the state tomography experiment.
+        """
+        totals = np.maximum(self.counts, 1)
+        expectations = np.where(self.counts > 0, 2 * self.plus_counts / totals - 1, 0)
+        expectations[0] = 1  # the identity
+        stddevs = np.where(self.counts > 0, np.sqrt((1 - expectations ** 2) / totals), 0)
+        return ExperimentResultArrays(settings=self.settings, expectations=expectations,
+                                      stddevs=stddevs, counts=self.counts.copy())
+
+    def linear_inv_estimate(self) -> np.ndarray:
+        """
+        :return: The linear inversion estimate, see :py:func:`linear_inv_state_estimate`.
+        """
+        return linear_inv_state_estimate(self.result_arrays(), self.qubits)
+
+    def mle_estimate(self, warm_start_mixing=1e-3, **kwargs) -> Tuple[TomographyEstimate, str]:
+        """
+        The iterative MLE estimate of :py:func:`iterative_mle_state_estimate`, started from the
+        previous MLE estimate.
+
+        :param warm_start_mixing: The weight of the maximally mixed state mixed into the previous
+            estimate before restarting from it, which keeps the start full rank.
+        :param kwargs: Passed on to :py:func:`iterative_mle_state_estimate`.
+        :return: The estimate and the status of the iteration.
+        """
+        initial_state = None
+        if self._mle_state is not None:
+            dim = 2 ** len(self.qubits)
+            initial_state = ((1 - warm_start_mixing) * self._mle_state
+                             + warm_start_mixing * np.eye(dim) / dim)
+        estimate, status = iterative_mle_state_estimate(self.result_arrays(), self.qubits,
+                                                        initial_state=initial_state, **kwargs)
+        self._mle_state = estimate.estimate.state_point_est
+        return estimate, status
+
+
+def _pauli_action(pauli_term: PauliTerm, qubits: List[int], parity: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Represent the Pauli part of `pauli_term` (ignoring its coefficient) as a permutation and
+    phases, such that ``lifted_pauli(P, qubits) @ v == phases * v[permutation]``.
+
+    :param pauli_term: The Pauli operator.
+    :param qubits: The qubits, kron'ed together as in :py:func:`lifted_pauli`, i.e. qubits[0] is
+        the least significant bit of an index.
+    :param parity: The parity of the number of set bits of each index, np.arange(d).
+    :return: The permutation and the phases, each of length d.
+    """
+    x_mask = 0
+    z_mask = 0
+    n_y = 0
+    for bit, qubit in enumerate(qubits):
+        op = pauli_term[qubit]
+        if op in 'XY':
+            x_mask |= 1 << bit
+        if op in 'ZY':
+            z_mask |= 1 << bit
+        n_y += op == 'Y'
+    # P = i^n_y X^x Z^z, as Y = iXZ
+    permutation = np.arange(len(parity)) ^ x_mask
+    phases = 1j ** n_y * (1 - 2 * parity[permutation & z_mask])
+    return permutation, phases
+
+
+def low_rank_state_estimate(results: List[ExperimentResult], qubits: List[int], rank: int = 1,
+                            tol: float = 1e-10, maxiter: int = 10_000, rs=None,
+                            max_time: Optional[float] = None,
+                            callback: Optional[Callable[[IterationInfo], None]] = None) \
+        -> Tuple[np.ndarray, str]:
+    """
+    Estimate a state of (at most) rank `rank` by least squares over the factor A of
+    rho = A A^dagger / Tr(A A^dagger).
+
+    For nearly pure states this only needs a random subset of the Pauli settings, see
+    :py:func:`generate_random_state_tomography_experiment`, and it never forms a d x d matrix:
+    each measured Pauli is applied to A as a permutation and phases, so memory is O(d r) and
+    each iteration takes O(n_settings d r) time. The factorization keeps the estimate physical
+    without any projection, see
+
+    [BM] Local minima and convergence in low-rank semidefinite programming
+         Burer and Monteiro,
+         Math. Program. 103, 427 (2005)
+         https://doi.org/10.1007/s10107-004-0564-1
+
+    :param results: Results of (a subset of) the state tomography settings, e.g. from
+        :py:func:`generate_random_state_tomography_experiment`.
+    :param qubits: All qubits that were tomographized. This specifies the order in
+        which qubits will be kron'ed together.
+    :param rank: The rank r of the estimate.
+    :param tol: The gradient tolerance of the L-BFGS optimization.
+    :param maxiter: The maximum number of iterations of the optimization.
+    :param rs: Optional random state, used for the starting point.
+    :param max_time: The maximum wall-clock time in seconds, checked after every iteration,
+        after which the optimization is aborted with status MAXTIME.
+    :param callback: An optional function called after every iteration with an
+        :py:class:`IterationInfo`, whose cost is the sum of squared residuals and whose estimate
+        is the normalized factor A.
+    :return: The (d, r) factor A, normalized so that rho = A A^dagger, and the status of the
+        optimization: OPTIMAL, MAXITER, MAXTIME, or else the message of the optimizer describing why it
+        stopped, e.g. a failed line search.
+    """
+    if rs is None:
+        rs = np.random
+    results = ExperimentResultArrays.from_results(results)
+    dim = 2 ** len(qubits)
+
+    index = np.arange(dim)
+    parity = np.zeros(dim, dtype=int)
+    for bit in range(len(qubits)):
+        parity ^= (index >> bit) & 1
+
+    # the action of each Pauli, as a permutation and phases, is the same in every evaluation
+    actions = []
+    targets = []
+    for setting, expectation in zip(results.settings, results.expectations):
+        if is_identity(setting.out_operator):
+            continue
+        actions.append(_pauli_action(setting.out_operator, qubits, parity))
+        targets.append(np.real(expectation / np.conj(setting.out_operator.coefficient)))
+
+    def cost_and_gradient(params):
+        factor = (params[:dim * rank] + 1j * params[dim * rank:]).reshape(dim, rank)
+        norm = np.real(np.vdot(factor, factor))
+        cost = 0.
+        # the Wirtinger derivative d cost / d conj(A)
+        gradient = np.zeros_like(factor)
+        for (permutation, phases), target in zip(actions, targets):
+            pauli_factor = phases[:, np.newaxis] * factor[permutation]
+            expectation = np.real(np.vdot(factor, pauli_factor)) / norm
+            residual = expectation - target
+            cost += residual ** 2
+            gradient += 2 * residual * (pauli_factor - expectation * factor) / norm
+        # the gradient with respect to the real and imaginary parts of A is 2 d cost / d conj(A)
+        return cost, 2 * np.concatenate([gradient.real.ravel(), gradient.imag.ravel()])
+
+    def normalized_factor(params):
+        factor = (params[:dim * rank] + 1j * params[dim * rank:]).reshape(dim, rank)
+        return factor / np.linalg.norm(factor)
+
+    start_time = time.perf_counter()
+    progress = {'iteration': 0, 'params': rs.normal(size=2 * dim * rank)}
+
+    def on_iteration(params):
+        progress['iteration'] += 1
+        if callback is not None:
+            factor = normalized_factor(params)
+            step_size = np.linalg.norm(factor - normalized_factor(progress['params']))
+            callback(IterationInfo(iteration=progress['iteration'],
+                                   cost=float(cost_and_gradient(params)[0]), step_size=step_size,
+                                   elapsed=time.perf_counter() - start_time, estimate=factor))
+        progress['params'] = np.copy(params)
+        # only the time budget is checked here; minimize enforces maxiter itself
+        if _budget_status(progress['iteration'], None, start_time, max_time) is not None:
+            raise _BudgetExhausted
+
+    try:
+        result = minimize(cost_and_gradient, progress['params'], jac=True, method='L-BFGS-B',
+                          callback=on_iteration, options={'gtol': tol, 'maxiter': maxiter})
+    except _BudgetExhausted:
+        return normalized_factor(progress['params']), MAXTIME
+    if result.success:
+        status = OPTIMAL
+    elif result.nit >= maxiter:
+        status = MAXITER
+    else:
+        status = str(result.message)
+    return normalized_factor(result.x), status
 
 
 def proj_to_cp(choi_vec):
@@ -577,18 +1380,14 @@ def proj_to_tp(choi_vec):
     :return: The vectorized Choi representation of the projected TP process
     """
     dim = int(np.sqrt(np.sqrt(choi_vec.size)))
-    b = vec(np.eye(dim, dim))
-    # construct M, which acts as partial trace over output Hilbert space
-    M = np.zeros((dim ** 2, dim ** 4))
-    for i in range(dim):
-        e = np.zeros((dim, 1))
-        e[i] = 1
-        B = np.kron(np.eye(dim, dim), e.T)
-        M = M + np.kron(B, B)
-    return choi_vec + 1 / dim * (M.conj().T @ b - M.conj().T @ M @ choi_vec)
+    # M^dag (b - M c) from [PGD] with M the partial trace over the output Hilbert space; M^dag x acts
+    # as kron(x, I), so neither M nor any d^2 x d^4 intermediate needs to be constructed.
+    pt = partial_trace(unvec(choi_vec), dims=[dim, dim], keep=[0])
+    return choi_vec + vec(np.kron((np.eye(dim) - pt) / dim, np.eye(dim)))
 
 
-def _constraint_project(choi_mat, trace_preserving=True):
+def _constraint_project(choi_mat, trace_preserving=True, tol=1e-4, maxiter=100_000,
+                        callback: Optional[Callable[[IterationInfo], None]] = None):
     """
     Projects the given Choi matrix into the subspace of Completetly Positive and either Trace Perserving (TP) or
     Trace-Non-Increasing maps.
@@ -603,15 +1402,38 @@ def _constraint_project(choi_mat, trace_preserving=True):
 
     :param choi_mat: A density matrix corresponding to the Choi representation estimate of a quantum process.
     :param trace_preserving: Default project the estimate to a trace-preserving process. False for trace non-increasing
+    :param tol: The threshold of the stopping criterion of [DYKALG].
+    :param maxiter: The maximum number of iterations.
+    :param callback: An optional function called after every iteration with an
+        :py:class:`IterationInfo`, whose cost is the stopping criterion.
     :return: The choi representation of CPTP map that is closest to the given state.
     """
+    return _dykstra_project(choi_mat, trace_preserving, tol, maxiter, callback)[0]
+
+
+def _dykstra_project(choi_mat, trace_preserving=True, tol=1e-4, maxiter=100_000,
+                     callback: Optional[Callable[[IterationInfo], None]] = None) \
+        -> Tuple[np.ndarray, int]:
+    """
+    Dykstra's algorithm behind :py:func:`_constraint_project`.
+
+    :param choi_mat: The Choi matrix to project.
+    :param trace_preserving: Project to trace-preserving maps if True, else trace non-increasing.
+    :param tol: See :py:func:`_constraint_project`.
+    :param maxiter: See :py:func:`_constraint_project`.
+    :param callback: See :py:func:`_constraint_project`.
+    :return: The projected Choi matrix and the number of Dykstra iterations taken.
+    """
+    start_time = time.perf_counter()
     shape = choi_mat.shape
     old_CP_change = vec(np.zeros(shape))
     old_TP_change = vec(np.zeros(shape))
     last_CP_projection = vec(np.zeros(shape))
     last_state = vec(choi_mat)
 
+    iterations = 0
     while True:
+        iterations += 1
         # Dykstra's algorithm
         pre_CP = last_state - old_CP_change
         CP_projection = proj_to_cp(pre_CP)
@@ -629,9 +1451,16 @@ def _constraint_project(choi_mat, trace_preserving=True):
         state_change = new_state - last_state
 
         # stopping criterion
-        if np.linalg.norm(CP_change_change, ord=2) ** 2 + np.linalg.norm(TP_change_change, ord=2) ** 2 \
-                + 2 * abs(np.dot(old_TP_change.conj().T, state_change)) \
-                + 2 * abs(np.dot(old_CP_change.conj().T, (CP_projection - last_CP_projection))) < 1e-4:
+        criterion = np.linalg.norm(CP_change_change, ord=2) ** 2 \
+            + np.linalg.norm(TP_change_change, ord=2) ** 2 \
+            + 2 * abs(np.vdot(old_TP_change, state_change)) \
+            + 2 * abs(np.vdot(old_CP_change, CP_projection - last_CP_projection))
+        if callback is not None:
+            callback(IterationInfo(iteration=iterations, cost=criterion,
+                                   step_size=np.linalg.norm(state_change),
+                                   elapsed=time.perf_counter() - start_time,
+                                   estimate=unvec(new_state)))
+        if criterion < tol or iterations >= maxiter:
             break
 
         # store results from this iteration
@@ -640,7 +1469,76 @@ def _constraint_project(choi_mat, trace_preserving=True):
         last_CP_projection = CP_projection
         last_state = new_state
 
-    return unvec(new_state)
+    return unvec(new_state), iterations
+
+
+class ProcessMeasurementOperator(LinearOperator):
+    """
+    The matrix A of [PGD] eq. (22), such that the probabilities p_ij of outcomes n_ij given an
+    estimate E of the Choi matrix are ``p = A vec(E)``, applied without constructing A.
+
+    Row j of A is vec(rho_i^T (x) Pi_j)^T / d^2 for input state rho_i and POVM element Pi_j,
+    so A factors over the (few) distinct input states. For each of these the forward map
+    computes the output operator Tr_in[(rho_i^T (x) I) E] with one matrix product and then all
+    Pauli expectations of it with :py:func:`pauli_basis_traces`; the adjoint reverses these
+    steps with :py:func:`pauli_basis_sum`. Both cost O(n_in d^4) rather than the O(n_settings d^4)
+    of a dense A.
+    """
+
+    def __init__(self, results: List[ExperimentResult], qubits: List[int]):
+        """
+        :param results: The ExperimentResults whose settings define the rows of A; each result
+            contributes a row for the +1 and then the -1 outcome of its out_operator.
+        :param qubits: The qubits, in the order in which they are kron'ed together.
+        """
+        self.dim = 2 ** len(qubits)
+        in_state_index = {}
+        in_states = []
+        in_state_indices = []
+        for result in results:
+            key = str(result.setting.in_state)
+            if key not in in_state_index:
+                in_state_index[key] = len(in_states)
+                in_states.append(lifted_state_operator(result.setting.in_state, qubits=qubits))
+            in_state_indices.append(in_state_index[key])
+        self.in_states = np.asarray(in_states, dtype=complex)
+        self.in_state_indices = np.asarray(in_state_indices, dtype=int)
+
+        pauli_indices, coefficients = _pauli_basis_indices([result.setting.out_operator
+                                                            for result in results], qubits)
+        self.pauli_indices = np.asarray(pauli_indices, dtype=int)
+        self.coefficients = np.asarray(coefficients)
+        super().__init__(dtype=complex, shape=(2 * len(results), self.dim ** 4))
+
+    def _matvec(self, choi_vec):
+        d = self.dim
+        # E[(i, k), (j, l)] -> E[(i, j), (k, l)], where i, j index the input space
+        choi = unvec(np.reshape(choi_vec, (-1, 1))).reshape(d, d, d, d).transpose(0, 2, 1, 3)
+        outputs = (self.in_states.reshape(len(self.in_states), -1) @ choi.reshape(d ** 2, d ** 2))
+        traces = pauli_basis_traces(outputs.reshape(-1, d, d))
+        identity_part = traces[self.in_state_indices, 0]
+        pauli_part = self.coefficients * traces[self.in_state_indices, self.pauli_indices]
+
+        probs = np.empty(self.shape[0], dtype=complex)
+        probs[0::2] = (identity_part + pauli_part) / 2
+        probs[1::2] = (identity_part - pauli_part) / 2
+        return probs / d ** 2
+
+    def _rmatvec(self, weights):
+        d = self.dim
+        weights = np.reshape(weights, -1)
+        plus, minus = weights[0::2], weights[1::2]
+        # sum the conjugated POVM elements belonging to each input state in the Pauli basis
+        pauli_coefficients = np.zeros((len(self.in_states), d ** 2), dtype=complex)
+        np.add.at(pauli_coefficients, (self.in_state_indices, 0), (plus + minus) / 2)
+        np.add.at(pauli_coefficients, (self.in_state_indices, self.pauli_indices),
+                  np.conj(self.coefficients) * (plus - minus) / 2)
+        outputs = pauli_basis_sum(pauli_coefficients)
+
+        adjoint = self.in_states.conj().reshape(len(self.in_states), -1).T \
+            @ outputs.reshape(len(self.in_states), -1)
+        adjoint = adjoint.reshape(d, d, d, d).transpose(0, 2, 1, 3).reshape(d ** 2, d ** 2)
+        return vec(adjoint).reshape(-1) / d ** 2
 
 
 def _extract_from_results(results: List[ExperimentResult], qubits: List[int]):
@@ -653,27 +1551,12 @@ def _extract_from_results(results: List[ExperimentResult], qubits: List[int]):
         p = vec(p_ij) = A x vec(E)
 
     This yields convenient vectorized calculations of the cost and its gradient, in terms of A, n,
-    and E.
+    and E. A is returned as a :py:class:`ProcessMeasurementOperator`.
     """
-    A = []
     n = []
     grand_total_shots = 0
 
     for result in results:
-        in_state_matrix = lifted_state_operator(result.setting.in_state, qubits=qubits)
-        operator = lifted_pauli(result.setting.out_operator, qubits=qubits)
-        proj_plus = (np.eye(2 ** len(qubits)) + operator) / 2
-        proj_minus = (np.eye(2 ** len(qubits)) - operator) / 2
-
-        # Constructing A per eq. (22)
-        # TODO: figure out if we can avoid re-splitting into Pi+ and Pi- counts
-        A += [
-            # vec() turns into a column vector; transpose to a row vector; index into the
-            # 1 row to avoid an extra tensor dimension when we call np.asarray(A).
-            vec(np.kron(in_state_matrix, proj_plus.T)).T[0],
-            vec(np.kron(in_state_matrix, proj_minus.T)).T[0],
-        ]
-
         expected_plus_ones = (1 + result.expectation) / 2
         n += [
             result.total_counts * expected_plus_ones,
@@ -681,15 +1564,40 @@ def _extract_from_results(results: List[ExperimentResult], qubits: List[int]):
         ]
         grand_total_shots += result.total_counts
 
-    n_qubits = len(qubits)
-    dimension = 2 ** n_qubits
-    A = np.asarray(A) / dimension ** 2
+    A = ProcessMeasurementOperator(results, qubits)
     n = np.asarray(n)[:, np.newaxis] / grand_total_shots
     return A, n
 
 
+@dataclass
+class PGDBStatistics:
+    """Convergence report of a projected gradient descent process estimate"""
+
+    iterations: int
+    """The number of gradient steps taken"""
+
+    projection_iterations: int
+    """The total number of Dykstra iterations spent projecting onto the constraint set"""
+
+    restarts: int
+    """The number of times the momentum was reset; always zero without acceleration"""
+
+    final_cost: float
+    """The cost (negative log likelihood) of the returned estimate"""
+
+    elapsed: float
+    """Wall-clock time of the estimation in seconds"""
+
+    status: str
+    """OPTIMAL if the cost converged, else MAXITER or MAXTIME if a budget ran out first"""
+
+
 def pgdb_process_estimate(results: List[ExperimentResult], qubits: List[int],
-                          trace_preserving=True) -> np.ndarray:
+                          trace_preserving=True, accelerated=False, full_output=False,
+                          tol=1e-10, projection_tol=1e-4, maxiter: Optional[int] = 100_000,
+                          max_time: Optional[float] = None,
+                          callback: Optional[Callable[[IterationInfo], None]] = None) \
+        -> Union[np.ndarray, Tuple[np.ndarray, PGDBStatistics]]:
     """
     Provide an estimate of the process via Projected Gradient Descent with Backtracking.
 
@@ -699,12 +1607,37 @@ def pgdb_process_estimate(results: List[ExperimentResult], qubits: List[int],
           https://dx.doi.org/10.1103/PhysRevA.98.062336
           https://arxiv.org/abs/1803.10062
 
+    With `accelerated` the gradient is taken at a Nesterov/FISTA extrapolation of the last two
+    estimates, and the momentum is restarted (falling back to a plain backtracking step)
+    whenever the cost fails to decrease, as in
+
+    [RESTART] Adaptive Restart for Accelerated Gradient Schemes
+              O'Donoghue and Candès,
+              Found. Comput. Math. 15, 715 (2015)
+              https://arxiv.org/abs/1204.3982
+
+    This converges to the same maximum likelihood estimate in several times fewer gradient
+    steps and CPTP projections on two- and three-qubit processes.
+
     :param results: A tomographically complete list of ExperimentResults
     :param qubits: A list of qubits giving the tensor order of the resulting Choi matrix.
     :param trace_preserving: Whether to project the estimate to a trace-preserving process. If
         set to False, we ensure trace non-increasing.
-    :return: an estimate of the process in the Choi matrix representation.
+    :param accelerated: Use momentum with adaptive restart.
+    :param full_output: If True, also return a :py:class:`PGDBStatistics` with iteration counts
+        and timing.
+    :param tol: Stop once a step decreases the cost by less than this.
+    :param projection_tol: The tolerance of each CPTP projection, see
+        :py:func:`_constraint_project`.
+    :param maxiter: The maximum number of gradient steps, or None for no limit.
+    :param max_time: The maximum wall-clock time in seconds, or None for no limit.
+    :param callback: An optional function called after every gradient step with an
+        :py:class:`IterationInfo`, whose cost is the negative log likelihood, e.g. a
+        :py:class:`ConvergenceTrace`.
+    :return: an estimate of the process in the Choi matrix representation, and the statistics if
+        `full_output` is set.
     """
+    start_time = time.perf_counter()
     # construct the matrix A and vector n from the data for vectorized calculations of
     # the cost function and its gradient
     A, n = _extract_from_results(results, qubits[::-1])
@@ -714,32 +1647,88 @@ def pgdb_process_estimate(results: List[ExperimentResult], qubits: List[int],
     old_cost = _cost(A, n, est)  # initial cost, which we want to decrease
     mu = 3 / (2 * dim ** 2)  # inverse learning rate
     gamma = .3  # tolerance of letting the constrained update deviate from true gradient; larger is more demanding
-    while True:
-        gradient = _grad_cost(A, n, est)
-        update = _constraint_project(est - gradient / mu, trace_preserving) - est
-
-        # determine step size factor, alpha
-        alpha = 1
-        new_cost = _cost(A, n, est + alpha * update)
-        change = gamma * alpha * np.dot(vec(update).conj().T, vec(gradient))
-        while new_cost > old_cost + change:
-            alpha = .5 * alpha
-            change = .5 * change  # directly update change, corresponding to update of alpha
-            new_cost = _cost(A, n, est + alpha * update)
 
-            # small alpha stopgap
-            if alpha < 1e-15:
-                break
+    # momentum state; without acceleration the extrapolated point is always the estimate itself
+    extrapolated = est
+    momentum = 1.
+    iterations, projection_iterations, restarts = 0, 0, 0
+    status = OPTIMAL
+    while True:
+        budget_status = _budget_status(iterations, maxiter, start_time, max_time)
+        if budget_status is not None:
+            status = budget_status
+            break
+        iterations += 1
+        gradient = _grad_cost(A, n, extrapolated)
+        projected, n_proj = _dykstra_project(extrapolated - gradient / mu, trace_preserving,
+                                             tol=projection_tol)
+        projection_iterations += n_proj
+
+        if extrapolated is not est:
+            # take the full accelerated step unless it fails to decrease the cost
+            new_cost = _cost(A, n, projected)
+            if new_cost < old_cost:
+                new_momentum = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+                extrapolated = projected + (momentum - 1) / new_momentum * (projected - est)
+                momentum = new_momentum
+                converged = old_cost - new_cost < tol
+                step_size = np.linalg.norm(projected - est)
+                est, old_cost = projected, new_cost
+            else:
+                # restart from the current estimate
+                restarts += 1
+                extrapolated, momentum = est, 1.
+                converged, step_size = False, 0.
+        else:
+            update = projected - est
 
-        # update estimate
-        est += alpha * update
-        if old_cost - new_cost < 1e-10:
+            # determine step size factor, alpha
+            alpha = 1
+            new_cost = _cost(A, n, est + alpha * update)
+            change = gamma * alpha * np.dot(vec(update).conj().T, vec(gradient))
+            while new_cost > old_cost + change:
+                alpha = .5 * alpha
+                change = .5 * change  # directly update change, corresponding to update of alpha
+                new_cost = _cost(A, n, est + alpha * update)
+
+                # small alpha stopgap
+                if alpha < 1e-15:
+                    break
+
+            # update estimate
+            est = est + alpha * update
+            step_size = alpha * np.linalg.norm(update)
+            converged = old_cost - new_cost < tol
+            # store current cost
+            old_cost = new_cost
+            extrapolated = est
+            if accelerated:
+                # build up momentum from this (plain) step; the first step after a (re)start has
+                # none, so that the next step is again a backtracking one
+                new_momentum = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+                if momentum > 1:
+                    extrapolated = est + (momentum - 1) / new_momentum * (alpha * update)
+                momentum = new_momentum
+
+        if callback is not None:
+            callback(IterationInfo(iteration=iterations, cost=float(np.real(old_cost)),
+                                   step_size=step_size,
+                                   elapsed=time.perf_counter() - start_time, estimate=est))
+        if converged:
             break
-        # store current cost
-        old_cost = new_cost
 
+    if not full_output:
+        return est
 
-    return est
+    stats = PGDBStatistics(
+        iterations=iterations,
+        projection_iterations=projection_iterations,
+        restarts=restarts,
+        final_cost=float(np.real(_cost(A, n, est))),
+        elapsed=time.perf_counter() - start_time,
+        status=status
+    )
+    return est, stats
 
 
 def _cost(A, n, estimate, eps=1e-6):
@@ -778,7 +1767,7 @@ def _grad_cost(A, n, estimate, eps=1e-6):
     # see appendix on "stalling"
     p = np.clip(p, a_min=eps, a_max=None)
     eta = n / p
-    return unvec(-A.conj().T @ eta)
+    return unvec(-(aslinearoperator(A).H @ eta))
 
 
 def project_density_matrix(rho) -> np.ndarray:
@@ -795,73 +1784,119 @@ def project_density_matrix(rho) -> np.ndarray:
              https://doi.org/10.1103/PhysRevLett.108.070502
              https://arxiv.org/abs/1106.5458
 
-    :param rho: Numpy array containing the density matrix with dimension (N, N)
-    :return rho_projected: The closest positive semi-definite trace 1 matrix to rho.
-    """
+    A stack of matrices, e.g. bootstrap resamples from :py:func:`linear_inv_state_estimate`, is
+    projected at once with a batched eigendecomposition.
 
+    :param rho: Numpy array containing the density matrix with dimension (N, N), or a
+        (..., N, N) stack of density matrices.
+    :return rho_projected: The closest positive semi-definite trace 1 matrix to rho, or the stack
+        of projections.
+    """
+    rho = np.asarray(rho)
     # Rescale to trace 1 if the matrix is not already
-    rho_impure = rho / np.trace(rho)
+    rho_impure = rho / np.trace(rho, axis1=-2, axis2=-1)[..., np.newaxis, np.newaxis]
 
-    dimension = rho_impure.shape[0]  # the dimension of the Hilbert space
-    [eigvals, eigvecs] = eigh(rho_impure)
+    dimension = rho_impure.shape[-1]  # the dimension of the Hilbert space
+    eigvals, eigvecs = np.linalg.eigh(rho_impure)
 
-    # If matrix is already trace one PSD, we are done
-    if np.min(eigvals) >= 0:
+    # If every matrix is already trace one PSD, we are done
+    physical = np.min(eigvals, axis=-1) >= 0
+    if np.all(physical):
         return rho_impure
 
-    # Otherwise, continue finding closest trace one, PSD matrix
-    eigvals = list(eigvals)
-    eigvals.reverse()
-    eigvals_new = [0.0] * len(eigvals)
+    # Otherwise, find the closest trace one, PSD matrix. With the eigenvalues in decreasing
+    # order, the largest i for which eigval_i + (sum_{j > i} eigval_j) / i >= 0 is where the
+    # sequential algorithm of [MLEWIZ] stops: the eigenvalues after i are set to zero, and their
+    # sum is spread evenly over the first i.
+    descending = eigvals[..., ::-1]
+    num_kept = np.arange(1, dimension + 1)
+    accumulator = np.sum(descending, axis=-1, keepdims=True) - np.cumsum(descending, axis=-1)
+    keep = descending + accumulator / num_kept >= 0
+    n_kept = dimension - np.argmax(keep[..., ::-1], axis=-1, keepdims=True)
+    shift = np.take_along_axis(accumulator, n_kept - 1, axis=-1) / n_kept
+    eigvals_new = np.where(num_kept <= n_kept, descending + shift, 0.)[..., ::-1]
 
-    i = dimension
-    accumulator = 0.0  # Accumulator
-    while eigvals[i - 1] + accumulator / float(i) < 0:
-        accumulator += eigvals[i - 1]
-        i -= 1
-    for j in range(i):
-        eigvals_new[j] = eigvals[j] + accumulator / float(i)
-    eigvals_new.reverse()
+    # Reconstruct the matrices
+    rho_projected = (eigvecs * eigvals_new[..., np.newaxis, :]) @ eigvecs.conj().swapaxes(-1, -2)
+    return np.where(physical[..., np.newaxis, np.newaxis], rho_impure, rho_projected)
 
-    # Reconstruct the matrix
-    rho_projected = functools.reduce(np.dot, (eigvecs,
-                                              np.diag(eigvals_new),
-                                              np.conj(eigvecs.T)))
 
-    return rho_projected
+def _resample_expectation_arrays_with_beta(results: ExperimentResultArrays, n_resamples: int,
+                                           prior_counts=1, rs=None) -> np.ndarray:
+    """Resample every expectation value n_resamples times, in one call, by constructing a beta
+    distribution for each setting and sampling from it.
 
+    Used by :py:func:`estimate_variance`.
 
-def _resample_expectations_with_beta(results, prior_counts=1):
-    """Resample expectation values by constructing a beta distribution and sampling from it.
+    :param results: The measured results.
+    :param n_resamples: The number of times to resample.
+    :param prior_counts: Number of "counts" to add to alpha and beta for the beta distribution
+        from which we sample.
+    :param rs: Optional random state or ``np.random.Generator``; defaults to ``np.random``.
+    :return: A (n_resamples, n_settings) array of resampled expectation values.
+    """
+    if rs is None:
+        rs = np.random
 
-    Used by :py:func:`estimate_variance`.
+    # reconstruct the raw counts of observations from the pauli observable mean
+    num_plus = ((results.expectations + 1) / 2) * results.counts
+    num_minus = results.counts - num_plus
+
+    # We resample this data assuming it was from a beta distribution,
+    # with additive smoothing
+    alpha = num_plus + prior_counts
+    beta = num_minus + prior_counts
+
+    # transform bit bias back to pauli expectation value
+    return 2 * rs.beta(alpha, beta, size=(n_resamples, len(results))) - 1
+
+
+def _resample_expectations_with_beta(results, prior_counts=1, rs=None):
+    """Resample expectation values by constructing a beta distribution and sampling from it.
 
     :param results: A list of ExperimentResults
     :param prior_counts: Number of "counts" to add to alpha and beta for the beta distribution
         from which we sample.
+    :param rs: Optional random state or ``np.random.Generator``; defaults to ``np.random``.
     :return: A new list of ``results`` where each ExperimentResult's ``expectation`` field
         contained a resampled expectation value
     """
-    resampled_results = []
-    for result in results:
-        # reconstruct the raw counts of observations from the pauli observable mean
-        num_plus = ((result.expectation + 1) / 2) * result.total_counts
-        num_minus = result.total_counts - num_plus
-
-        # We resample this data assuming it was from a beta distribution,
-        # with additive smoothing
-        alpha = num_plus + prior_counts
-        beta = num_minus + prior_counts
-
-        # transform bit bias back to pauli expectation value
-        resampled_expect = 2 * np.random.beta(alpha, beta) - 1
-        resampled_results += [ExperimentResult(
-            setting=result.setting,
-            expectation=resampled_expect,
-            stddev=result.stddev,
-            total_counts=result.total_counts,
-        )]
-    return resampled_results
+    results = ExperimentResultArrays.from_results(results)
+    resampled = _resample_expectation_arrays_with_beta(results, 1, prior_counts, rs)
+    return list(replace(results, expectations=resampled[0]))
+
+
+def _state_functional(rho, functional, target_state, project_to_physical) -> float:
+    """
+    Evaluate the functional used by :py:func:`estimate_variance` on an estimated state.
+    """
+    if project_to_physical:
+        rho = project_density_matrix(rho)
+
+    # Calculate functional of the state
+    if functional == dm.purity:
+        return np.real(dm.purity(rho, dim_renorm=False))
+    else:
+        return np.real(functional(target_state, rho))
+
+
+def _bootstrap_functional(resampled_results: ExperimentResultArrays, qubits, tomo_estimator,
+                          functional, target_state, project_to_physical) -> float:
+    """
+    Estimate the state from a single bootstrap resample and evaluate the functional on it.
+
+    Used by :py:func:`estimate_variance`. This is a module level function so that it can be
+    sent to worker processes.
+    """
+    estimate = tomo_estimator(resampled_results, qubits)
+
+    # TODO: Shim! over different return values between linear inv. and mle
+    if isinstance(estimate, np.ndarray):
+        rho = estimate
+    else:
+        rho = estimate.estimate.state_point_est
+
+    return _state_functional(rho, functional, target_state, project_to_physical)
 
 
 def estimate_variance(results: List[ExperimentResult],
@@ -870,11 +1905,19 @@ def estimate_variance(results: List[ExperimentResult],
                       functional: Callable,
                       target_state=None,
                       n_resamples: int = 40,
-                      project_to_physical: bool = False) -> Tuple[float, float]:
+                      project_to_physical: bool = False,
+                      seed: Optional[Union[int, np.random.SeedSequence]] = None,
+                      n_jobs: int = 1) -> Tuple[float, float]:
     """
     Use a simple bootstrap-like method to return an errorbar on some functional of the
     quantum state.
 
+    All of the resampled expectation values are drawn up front, as a single
+    (n_resamples, n_settings) array, from a generator seeded by ``seed``; so for a given seed the
+    result is identical regardless of ``n_jobs`` or the machine it is run on. Each resample is
+    passed to ``tomo_estimator`` as an :py:class:`ExperimentResultArrays`. If ``tomo_estimator``
+    is :py:func:`linear_inv_state_estimate` every resample is estimated in one call.
+
     :param results: Measured results from a state tomography experiment
     :param qubits: Qubits that were tomographized.
     :param tomo_estimator: takes in ``results, qubits`` and returns a corresponding
@@ -885,31 +1928,47 @@ def estimate_variance(results: List[ExperimentResult],
     :param n_resamples: The number of times to resample.
     :param project_to_physical: Whether to project the estimated state to a physical one
         with :py:func:`project_density_matrix`.
+    :param seed: Optional seed, or SeedSequence, for the resampling. If None, the seed is drawn
+        from ``np.random`` so that seeding the global random state still gives reproducible
+        results.
+    :param n_jobs: The number of worker processes over which to spread the resamples. If
+        greater than 1, ``tomo_estimator`` and ``functional`` must be picklable, e.g. defined at
+        module level.
     """
     if functional != dm.purity:
         if target_state is None:
             raise ValueError("You're not using the `purity` functional. "
                              "Please specify a target state.")
 
-    sample_estimate = []
-    for _ in range(n_resamples):
-        resampled_results = _resample_expectations_with_beta(results)
-        estimate = tomo_estimator(resampled_results, qubits)
+    if seed is None:
+        seed = np.random.randint(0, 2 ** 63 - 1, dtype=np.int64)
 
-        # TODO: Shim! over different return values between linear inv. and mle
-        if isinstance(estimate, np.ndarray):
-            rho = estimate
-        else:
-            rho = estimate.estimate.state_point_est
+    results = ExperimentResultArrays.from_results(results)
+    resampled = _resample_expectation_arrays_with_beta(results, n_resamples,
+                                                       rs=np.random.default_rng(seed))
 
+    if tomo_estimator is linear_inv_state_estimate:
+        rhos = linear_inv_state_estimate(replace(results, expectations=resampled), qubits)
         if project_to_physical:
-            rho = project_density_matrix(rho)
-
-        # Calculate functional of the state
-        if functional == dm.purity:
-            sample_estimate.append(np.real(dm.purity(rho, dim_renorm=False)))
-        else:
-            sample_estimate.append(np.real(functional(target_state, rho)))
+            rhos = project_density_matrix(rhos)
+        sample_estimate = [_state_functional(rho, functional, target_state, False)
+                           for rho in rhos]
+        return np.mean(sample_estimate), np.var(sample_estimate)
+
+    bootstrap = functools.partial(_bootstrap_functional, qubits=qubits,
+                                  tomo_estimator=tomo_estimator, functional=functional,
+                                  target_state=target_state,
+                                  project_to_physical=project_to_physical)
+    resampled_results = [replace(results, expectations=expectations)
+                         for expectations in resampled]
+
+    if n_jobs > 1:
+        chunksize = int(np.ceil(n_resamples / n_jobs))
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            sample_estimate = list(executor.map(bootstrap, resampled_results,
+                                                chunksize=chunksize))
+    else:
+        sample_estimate = [bootstrap(resample) for resample in resampled_results]
 
     return np.mean(sample_estimate), np.var(sample_estimate)
 
@@ -1,7 +1,8 @@
+import functools
 import itertools
-from collections import OrderedDict
+from collections import OrderedDict, abc
 from random import random, seed
-from typing import Sequence, List, Set, Tuple
+from typing import Callable, Sequence, List, Set, Tuple
 from datetime import date, datetime
 from git import Repo
 import numpy as np
@@ -188,6 +189,73 @@ def prepare_prod_sic_state(ops):
     return prog
 
 
+# The Bloch sphere angles (theta, phi) of the single qubit SIC states and Pauli eigenstates, keyed
+# by the labels of pyquil's _OneQState, e.g. 'SIC2' or 'X1' for the -1 eigenstate of X.
+_SIC_THETA = 2 * np.arccos(1 / np.sqrt(3))
+LOCAL_STATE_BLOCH_ANGLES = {
+    'SIC0': (0, 0),
+    'SIC1': (_SIC_THETA, 0),
+    'SIC2': (_SIC_THETA, -2 * pi / 3),
+    'SIC3': (_SIC_THETA, 2 * pi / 3),
+    'X0': (pi / 2, 0),
+    'X1': (pi / 2, pi),
+    'Y0': (pi / 2, pi / 2),
+    'Y1': (pi / 2, -pi / 2),
+    'Z0': (0, 0),
+    'Z1': (pi, 0),
+}
+
+
+def prepare_parametric_prod_state(qubits: Sequence[int], angles) -> Program:
+    """
+    A parametric program preparing any product state on the given qubits, assuming the initial
+    state |0...0>.
+
+    Each qubit is prepared by RX(-pi/2) RZ(a) RX(-pi/2) RZ(b) with a = angles[2 * i] and
+    b = angles[2 * i + 1] for qubits[i], where a = theta - pi and b = phi for the state with
+    Bloch sphere angles (theta, phi). Angles for the states used in tomography are given by
+    :py:func:`local_state_prep_angles`. With `angles` a REAL memory region declared on the
+    program the preparation is compiled once and the state is chosen at run time through the
+    memory map.
+
+    :param qubits: The qubits to prepare.
+    :param angles: A REAL memory region (or any indexable of floats) with 2 * len(qubits) entries.
+    :return: The preparation program, implemented in native gates.
+    """
+    prep = Program()
+    for idx, qubit in enumerate(qubits):
+        prep += RX(-pi / 2, qubit)
+        prep += RZ(angles[2 * idx], qubit)
+        prep += RX(-pi / 2, qubit)
+        prep += RZ(angles[2 * idx + 1], qubit)
+    return prep
+
+
+def local_state_prep_angles(ops: Sequence[str], qubits: Sequence[int]) -> List[float]:
+    """
+    The angles for :py:func:`prepare_parametric_prod_state` that prepare the given product of
+    SIC states and Pauli eigenstates.
+
+    :param ops: Single qubit states in the format of :py:func:`prepare_prod_sic_state`, e.g.
+        ('SIC0_1', 'SIC2_0'), or with Pauli eigenstates, e.g. ('X0_1', 'Z1_0'). Qubits without a
+        state are prepared in |0>.
+    :param qubits: The qubits, in the order of the preparation program.
+    :return: The list of 2 * len(qubits) angles.
+    """
+    labels = {}
+    for op in ops:
+        label, qubit = op.split('_')
+        if label not in LOCAL_STATE_BLOCH_ANGLES:
+            raise ValueError('Unknown state preparation {}'.format(label))
+        labels[int(qubit)] = label
+
+    angles = []
+    for qubit in qubits:
+        theta, phi = LOCAL_STATE_BLOCH_ANGLES[labels.get(qubit, 'Z0')]
+        angles += [theta - pi, phi]
+    return angles
+
+
 def all_sic_terms(qubit_count: int, qubit_labels=None):
     SICS = ['SIC' + str(j) for j in range(4)]
     labels = [op for op in itertools.product(SICS, repeat=qubit_count)]
@@ -434,6 +502,7 @@ sigma_y = np.array([[0, -1.j], [1.j, 0]])
 sigma_z = np.array([[1, 0], [0, -1]])
 
 pauli_label_ops = [('I', np.eye(2)), ('X', sigma_x), ('Y', sigma_y), ('Z', sigma_z)]
+_PAULI_MATRICES = np.array([op for _, op in pauli_label_ops], dtype=complex)
 
 
 def pauli_basis_measurements(qubit):
@@ -449,20 +518,194 @@ def pauli_basis_measurements(qubit):
 PAULI_BASIS = OperatorBasis(pauli_label_ops)
 
 
-def n_qubit_pauli_basis(n):
+class _PauliBasisSequence(abc.Sequence):
+    """
+    A read-only sequence over the labels or operators of the n-qubit Pauli basis whose elements
+    are only constructed when they are accessed.
+    """
+
+    def __init__(self, n_qubits: int, element: Callable[[str], object]):
+        self.n_qubits = n_qubits
+        self.element = element
+
+    def __len__(self):
+        return 4 ** self.n_qubits
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[idx] for idx in range(len(self))[index]]
+        if not -len(self) <= index < len(self):
+            raise IndexError("Pauli basis index out of range")
+        return self.element(_pauli_label(index % len(self), self.n_qubits))
+
+
+def _pauli_label(index: int, n_qubits: int) -> str:
+    """
+    The label of operator `index` of ``n_qubit_pauli_basis(n_qubits)``, whose base 4 digits
+    index 'IXYZ' with the first qubit (the left-most tensor factor) most significant.
+    """
+    return ''.join('IXYZ'[(index >> (2 * (n_qubits - 1 - qubit))) & 3]
+                   for qubit in range(n_qubits))
+
+
+def _pauli_label_operator(label: str) -> np.ndarray:
+    """
+    The tensor product of the Pauli matrices in `label`, with the first the left-most factor.
+    """
+    return functools.reduce(np.kron, (_PAULI_MATRICES['IXYZ'.index(op)] for op in label))
+
+
+class PauliBasis(OperatorBasis):
+    """
+    The n-qubit Pauli operator basis, i.e. ``PAULI_BASIS ** n``, stored as a single contiguous,
+    read-only (4^n, 2^n, 2^n) array of operators.
+
+    In lazy mode neither the operators nor the labels are stored; each is constructed when it is
+    accessed, which takes O(4^n) memory rather than O(16^n).
+
+    The basis is shared by every caller of :py:func:`n_qubit_pauli_basis`, so its labels are a
+    tuple and its operators are read-only.
+    """
+
+    def __init__(self, n_qubits: int, lazy: bool = False):
+        """
+        OperatorBasis.__init__ is deliberately not called: it would copy every operator into an
+        OrderedDict and a list, which is what the array (or lazy) storage here avoids. The same
+        attributes are set instead, with ops_by_label computed on access.
+
+        :param n_qubits: The number of qubits.
+        :param lazy: Construct each operator, and each label, on demand.
+        """
+        self.n_qubits = n_qubits
+        self.lazy = lazy
+        self.dim = 4 ** n_qubits
+        if lazy:
+            self.labels = _PauliBasisSequence(n_qubits, str)
+            self.ops = _PauliBasisSequence(n_qubits, _pauli_label_operator)
+        else:
+            self.labels = tuple(''.join(label)
+                                for label in itertools.product('IXYZ', repeat=n_qubits))
+            ops = _PAULI_MATRICES
+            for _ in range(n_qubits - 1):
+                # kron each operator so far with each single qubit Pauli, as the new last factor
+                size = ops.shape[-1]
+                ops = np.einsum('aij,bkl->abikjl', ops, _PAULI_MATRICES)
+                ops = ops.reshape(4 * len(ops), 2 * size, 2 * size)
+            ops.flags.writeable = False
+            self.ops = ops
+
+    @property
+    def ops_by_label(self):
+        return OrderedDict(zip(self.labels, self.ops))
+
+    def index(self, label: str) -> int:
+        """
+        :param label: A label such as 'XIZ'.
+        :return: The index of the operator with this label in `labels` and `ops`.
+        """
+        if len(label) != self.n_qubits or not set(label) <= set('IXYZ'):
+            raise ValueError("{} is not a label of the {}-qubit Pauli basis."
+                             .format(label, self.n_qubits))
+        return int(label.translate(str.maketrans('IXYZ', '0123')), 4)
+
+    def operator(self, label: str) -> np.ndarray:
+        """
+        :param label: A label such as 'XIZ'.
+        :return: The operator with this label.
+        """
+        return self.ops[self.index(label)]
+
+
+def n_qubit_pauli_basis(n, lazy=False):
     """
     Construct the tensor product operator basis of `n` PAULI_BASIS's.
 
+    The operators are read-only, and the basis is memoized for each `n`, so that repeated calls
+    are free, except for dense bases on more than 5 qubits: these take 16^n complex entries
+    (270 MB at n = 6, 4 GB at n = 7), so are built afresh on every call and freed with the
+    result. For large `n` prefer ``lazy=True``, or :py:func:`pauli_basis_traces` and
+    :py:func:`pauli_basis_sum`, which never build the operators.
+
     :param int n: The number of qubits.
+    :param bool lazy: Construct each operator on demand rather than storing all 4^n of them,
+        see :py:class:`PauliBasis`.
     :return: The product Pauli operator basis of `n` qubits
-    :rtype: OperatorBasis
+    :rtype: PauliBasis
     """
     if n >= 1:
-        return PAULI_BASIS ** n
+        if lazy or n <= _MAX_CACHED_DENSE_QUBITS:
+            return _n_qubit_pauli_basis(n, lazy)
+        return PauliBasis(n, lazy)
     else:
         raise ValueError("n = {} should be at least 1.".format(n))
 
 
+# the largest number of qubits whose dense Pauli basis (16 MB at 5 qubits) is memoized
+_MAX_CACHED_DENSE_QUBITS = 5
+
+
+@functools.lru_cache(maxsize=8)
+def _n_qubit_pauli_basis(n: int, lazy: bool) -> PauliBasis:
+    return PauliBasis(n, lazy)
+
+
+def _n_qubits_from_dim(dim: int, base: int = 2) -> int:
+    """
+    Return n such that dim == base ** n, raising a ValueError if there is no such n.
+    """
+    n_qubits = int(round(np.log(dim) / np.log(base)))
+    if base ** n_qubits != dim:
+        raise ValueError("Dimension {} is not a power of {}.".format(dim, base))
+    return n_qubits
+
+
+def pauli_basis_traces(matrix: np.ndarray) -> np.ndarray:
+    """
+    Compute Tr[P_k M] for every operator P_k in ``n_qubit_pauli_basis(n)`` without constructing
+    the basis.
+
+    The trace is contracted one tensor factor at a time, so this costs O(n 4^n) operations and
+    O(4^n) memory rather than the O(16^n) needed to take the trace against each dense operator.
+
+    :param matrix: A (..., 2^n, 2^n) array. Any leading dimensions are treated as a batch.
+    :return: A (..., 4^n) array of traces ordered as the labels of ``n_qubit_pauli_basis(n)``.
+    """
+    matrix = np.asarray(matrix)
+    batch = matrix.shape[:-2]
+    n_qubits = _n_qubits_from_dim(matrix.shape[-1])
+    traces = matrix.reshape(batch + (1,) + matrix.shape[-2:])
+    for _ in range(n_qubits):
+        rest = traces.shape[-1] // 2
+        traces = traces.reshape(batch + (traces.shape[-3], 2, rest, 2, rest))
+        # Tr[P M] = sum_rc M_rc P_cr, taken over the leading tensor factor of M
+        traces = np.einsum('...brmcn,acr->...bamn', traces, _PAULI_MATRICES)
+        traces = traces.reshape(batch + (-1, rest, rest))
+    return traces.reshape(batch + (-1,))
+
+
+def pauli_basis_sum(coefficients: np.ndarray) -> np.ndarray:
+    """
+    Compute sum_k c_k P_k over the operators P_k of ``n_qubit_pauli_basis(n)`` without
+    constructing the basis. This is the adjoint of :py:func:`pauli_basis_traces`, i.e.
+    ``pauli_basis_sum(pauli_basis_traces(M)) / 2^n == M``.
+
+    :param coefficients: A (..., 4^n) array of coefficients ordered as the labels of
+        ``n_qubit_pauli_basis(n)``. Any leading dimensions are treated as a batch.
+    :return: A (..., 2^n, 2^n) array.
+    """
+    coefficients = np.asarray(coefficients)
+    batch = coefficients.shape[:-1]
+    n_qubits = _n_qubits_from_dim(coefficients.shape[-1], base=4)
+    matrix = coefficients.reshape(batch + (-1, 1, 1))
+    for _ in range(n_qubits):
+        rest = matrix.shape[-1]
+        matrix = matrix.reshape(batch + (matrix.shape[-3] // 4, 4, rest, rest))
+        # expand the least significant remaining Pauli label into a new leading tensor factor
+        matrix = np.einsum('...bamn,arc->...brmcn', matrix, _PAULI_MATRICES)
+        matrix = matrix.reshape(batch + (-1, 2 * rest, 2 * rest))
+    return matrix.reshape(batch + matrix.shape[-2:])
+
+
 def transform_pauli_moments_to_bit(mean_p, var_p):
     """
     Changes the first of a Pauli operator to the moments of a bit (a Bernoulli process).